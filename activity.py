@@ -24,6 +24,7 @@ import gi
 gi.require_version("Gtk", "3.0")
 
 from gi.repository import Gtk
+from gi.repository import Gdk
 
 from sugar3.activity import activity
 from sugar3.graphics.toolbutton import ToolButton
@@ -45,6 +46,9 @@ class Gmail(activity.Activity):
         self.canvas.connect("update-buttons", self._update_buttons_cb)
         self.set_canvas(self.canvas)
 
+        self.add_events(Gdk.EventMask.VISIBILITY_NOTIFY_MASK)
+        self.connect("visibility-notify-event", self._visibility_changed_cb)
+
         self.show_all()
 
     def make_toolbar(self):
@@ -82,6 +86,10 @@ class Gmail(activity.Activity):
         button = StopButton(self)
         toolbarbox.toolbar.insert(button, -1)
 
+    def _visibility_changed_cb(self, widget, event):
+        hidden = event.state == Gdk.VisibilityState.FULLY_OBSCURED
+        self.canvas.set_active(not hidden)
+
     def _update_buttons_cb(self, canvas, data):
         self.back_button.set_sensitive(data["back"])
         self.forward_button.set_sensitive(data["forward"])
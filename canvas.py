@@ -18,8 +18,6 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
-import threading
-
 from client import Client
 from redactor import Redactor
 from mail_viewer import MailViewer
@@ -27,12 +25,12 @@ from login_screen import LoginScreen
 from error_viewer import ErrorViewer
 from loading_view import LoadingView
 from mails_listbox import MailsListBox
+from refresh_scheduler import RefreshScheduler
 
 import gi
 gi.require_version("Gtk", "3.0")
 
 from gi.repository import Gtk
-from gi.repository import GLib
 from gi.repository import GObject
 
 
@@ -61,16 +59,19 @@ class GmailCanvas(Gtk.VBox):
         self.view_type = ViewType.NULL
         self.forward_view = ViewType.NULL
 
-        self.client = Client()
+        self.client = Client(max_workers=4)
         self.client.connect("profile-loaded", self.__profile_loaded_cb)
         self.client.connect("loading", self.__start_load)
         self.client.connect("loaded", self.__end_load)
+        self.client.connect("threads-changed", self.__threads_changed_cb)
         self.client.connect("thread-loaded", self.__thread_loaded_cb)
         self.client.connect("error", self.__error_cb)
         self.client.connect("login", self.__login_cb)
         self.client.connect("logged", self.__logged_cb)
         self.client.connect("mail-sent", self.__mail_sent_cb)
 
+        self.refresh_scheduler = RefreshScheduler(self.client)
+
         self.view_box = Gtk.VBox()
         self.pack_start(self.view_box, True, True, 0)
 
@@ -80,6 +81,8 @@ class GmailCanvas(Gtk.VBox):
         self.mails_listbox.connect("label-selected", self.__label_selected_cb)
         self.mails_listbox.connect("thread-selected", self.__thread_selected_cb)
         self.mails_listbox.connect("favorite-clicked", self.__favorite_clicked_cb)
+        self.mails_listbox.connect("load-more", self.__load_more_cb)
+        self.mails_listbox.connect("prefetch", self.__prefetch_cb)
 
         self.mail_viewer = MailViewer()
         self.mail_viewer.connect("send", self.__send_cb)
@@ -105,8 +108,6 @@ class GmailCanvas(Gtk.VBox):
         self.show_all()
 
     def __realize_cb(self, widget):
-        # thread = threading.Thread(target=self.client.start)
-        # thread.start()
         self.client.start()
 
     def __profile_loaded_cb(self, client, profile):
@@ -119,10 +120,18 @@ class GmailCanvas(Gtk.VBox):
 
     def __end_load(self, client, threads, labels):
         self.loading_view.stop()
-        self.set_view(ViewType.MAILS_LIST)
+        if self.view_type in [ViewType.NULL, ViewType.LOADING]:
+            self.set_view(ViewType.MAILS_LIST)
 
-        GLib.idle_add(self.mails_listbox.set_threads, threads)
-        GLib.idle_add(self.mails_listbox.set_labels, labels)
+        # Not deferred, so a "threads-changed" emitted right after can't
+        # be overwritten by these older lists
+        self.mails_listbox.set_threads(threads)
+        self.mails_listbox.set_labels(labels)
+
+    def __threads_changed_cb(self, client, threads):
+        # Background updates only patch the lists, switching views is left
+        # to "loaded" and "thread-loaded"
+        self.mails_listbox.update_threads(threads)
 
     def __thread_loaded_cb(self, client, thread):
         self.mail_viewer.set_thread(thread)
@@ -136,9 +145,8 @@ class GmailCanvas(Gtk.VBox):
         self.login_screen.set_url(url)
 
     def __logged_cb(self, client):
-        # thread = threading.Thread(target=self.client.load)
-        # thread.start()
         self.client.load()
+        self.refresh_scheduler.start()
 
     def __mail_sent_cb(self, client, mail):
         self.client.request_thread(mail["threadId"])
@@ -148,16 +156,18 @@ class GmailCanvas(Gtk.VBox):
         print "LABEL SELECTED", labelid
 
     def __thread_selected_cb(self, view, threadid):
-        # thread = threading.Thread(target=self.client.request_thread, args=(threadid,))
-        # thread.start()
         self.client.request_thread(threadid)
 
     def __favorite_clicked_cb(self, view, threadid, starred):
         self.client.set_star(threadid, starred)
 
+    def __load_more_cb(self, view, tab):
+        self.client.load_more(tab)
+
+    def __prefetch_cb(self, view, threadids):
+        self.client.prefetch(threadids)
+
     def __send_cb(self, widget, mail):
-        # thread = threading.Thread(target=self.client.send, args=(mail,))
-        # thread.start()
         self.client.send(mail)
 
     def __send_code_cb(self, screen, code):
@@ -178,6 +188,12 @@ class GmailCanvas(Gtk.VBox):
 
         self.emit("update-buttons", data)
 
+    def set_active(self, active):
+        if active:
+            self.refresh_scheduler.resume()
+        else:
+            self.refresh_scheduler.pause()
+
     def show_redactor(self):
         self.set_view(ViewType.REDACT, False)
         self.forward_view = ViewType.NULL
@@ -21,15 +21,33 @@
 import os
 import sys
 import socket
+import logging
 import httplib2
 import threading
 
-from constants import TABS, CATEGORIES
+from constants import TABS
+from utils import set_thread_flags
+from utils import get_thread_label_ids
+from lru_cache import LRUCache
+from mail_store import MailStore
+from label_queue import LabelQueue
+from history_sync import HistorySync
+from history_sync import HistoryExpired
+from gmail_discovery import revalidate
+from gmail_discovery import build_service
+from gmail_discovery import needs_revalidation
+from workers import WorkerPool
+from workers import idle_call
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import ParallelHttpRequest
+from googleapiclient.http import QuotaScheduler
+from googleapiclient.http import PRIORITY_INTERACTIVE
 
-from googleapiclient import discovery
 from oauth2client import client
 from oauth2client import tools
-from oauth2client.file import Storage
+from oauth2client.contrib.cached_file_storage import CachedFileStorage
+from oauth2client.transport import RefreshTimer
 
 import gi
 gi.require_version("Gdk", "3.0")
@@ -41,6 +59,37 @@ SCOPES = "https://mail.google.com/"
 CLIENT_SECRET_FILE = "client_secret.json"
 APPLICATION_NAME = "Sugar Gmail"
 CREDENTIALS_FILE = os.path.expanduser("~/.gmail-credentials.json")
+STORE_FILE = os.path.expanduser("~/.gmail-store.db")
+# Gmail rejects batches with more than 100 calls
+MAX_BATCH_SIZE = 100
+# Gmail allows 250 quota units per user per second, as a moving average
+QUOTA_UNITS_PER_SECOND = 250
+QUOTA_BURST = 1000
+# Quota units of the calls made, the rest are counted as DEFAULT_QUOTA_UNITS
+QUOTA_UNITS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.labels.list": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.threads.list": 10,
+    "gmail.users.threads.get": 10,
+    "gmail.users.threads.modify": 10,
+    "gmail.users.messages.send": 100,
+}
+DEFAULT_QUOTA_UNITS = 5
+# Times a rate limited or failed call is tried again
+MAX_RETRIES = 3
+# Threads fetched per page, and the most kept for each tab
+PAGE_SIZE = 25
+MAX_TAB_THREADS = 500
+# The most full threads kept in memory
+THREAD_CACHE_SIZE = 50
+# Idle keep-alive connections kept per host, and for how long (seconds)
+MAX_IDLE_CONNECTIONS = 4
+CONNECTION_IDLE_TIMEOUT = 60
+# Full threads downloaded at once when prefetching
+PARALLEL_FETCHES = MAX_IDLE_CONNECTIONS
+
+logger = logging.getLogger(__name__)
 
 
 class Client(GObject.GObject):
@@ -49,6 +98,7 @@ class Client(GObject.GObject):
         "profile-loaded": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, [GObject.TYPE_PYOBJECT]),
         "loading": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, []),
         "loaded": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, [GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT]),
+        "threads-changed": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, [GObject.TYPE_PYOBJECT]),
         "thread-loaded": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, [GObject.TYPE_PYOBJECT]),
         "error": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, []),
         "login": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, [GObject.TYPE_STRING]),
@@ -56,88 +106,517 @@ class Client(GObject.GObject):
         "mail-sent": (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE, [GObject.TYPE_PYOBJECT]),
     }
 
-    def __init__(self):
+    def __init__(self, max_workers=0):
         GObject.GObject.__init__(self)
 
         self.credentials = None
         self.service = None
         self.__storage = None
+        self.__refresh_timer = None
+        self.store = MailStore(STORE_FILE)
+        self.history = HistorySync(self)
+        # (thread id, history id) -> full thread
+        self.thread_cache = LRUCache(THREAD_CACHE_SIZE)
+        self.label_queue = LabelQueue(self)
+        self.__local = threading.local()
+        # Every call goes through it so that together they keep to the
+        # quota, the ones the user waits for first
+        self.scheduler = QuotaScheduler(
+            QUOTA_UNITS_PER_SECOND, QUOTA_BURST, QUOTA_UNITS,
+            DEFAULT_QUOTA_UNITS)
+        # Shared by the per-thread Http objects, so a worker reuses the
+        # TLS connections opened by the others
+        self.connection_pool = httplib2.ConnectionPool(
+            MAX_IDLE_CONNECTIONS, CONNECTION_IDLE_TIMEOUT)
+        # Ids of the threads being prefetched, so overlapping prefetches
+        # don't download them twice, and the idle Http objects they use
+        self.__prefetching = set()
+        self.__prefetch_https = []
+        self.__prefetch_lock = threading.Lock()
+
+        # With max_workers > 0 every network call runs in a worker thread
+        # and the signals are emitted from the main loop
+        self.__pool = None
+        # Jobs that change the stored thread lists run on a single worker,
+        # one at a time and in order, so none overwrites what another saved
+        self.__lists_pool = None
+        # Counts the full loads, so load_more can tell its list was replaced
+        self.__lists_generation = 0
+        if max_workers > 0:
+            self.__pool = WorkerPool(max_workers)
+            self.__lists_pool = WorkerPool(1)
+
+    def __emit(self, signal, *args):
+        if self.__pool is None:
+            self.emit(signal, *args)
+        else:
+            idle_call(self.emit, signal, *args)
+
+    def __run(self, func, *args):
+        if self.__pool is None:
+            func(*args)
+        else:
+            self.__pool.submit(func, args, error_callback=self.__worker_error_cb)
+
+    def __run_with_callbacks(self, func, args, callback, error_callback,
+                             pool=None):
+        if pool is None:
+            pool = self.__pool
+
+        if pool is None:
+            try:
+                result = func(*args)
+            except Exception as e:
+                error_callback(e)
+            else:
+                callback(result)
+        else:
+            pool.submit(func, args, callback, error_callback)
+
+    def __run_on_lists(self, func, *args):
+        """
+        Like __run, for the jobs that change the stored thread lists.
+        """
+        if self.__lists_pool is None:
+            func(*args)
+        else:
+            self.__lists_pool.submit(
+                func, args, error_callback=self.__worker_error_cb)
+
+    def __worker_error_cb(self, error):
+        self.emit("error")
+
+    def get_http(self):
+        """
+        Return an authorized Http for the calling thread, httplib2.Http
+        objects can't be shared between threads but their connections
+        are pooled.
+        """
+        http = getattr(self.__local, "http", None)
+        if http is None:
+            http = self.__new_http()
+            self.__local.http = http
+
+        return http
+
+    def __new_http(self):
+        http = httplib2.Http(connection_pool=self.connection_pool)
+        return self.credentials.authorize(http)
+
+    def __take_prefetch_http(self):
+        """
+        Return an idle authorized Http for a prefetch thread. Each prefetch
+        runs on new threads, so their Http objects are kept here instead
+        of per thread.
+        """
+        with self.__prefetch_lock:
+            if self.__prefetch_https:
+                return self.__prefetch_https.pop()
+
+        return self.__new_http()
 
     def load(self):
-        self.emit("loading")
+        self.__run_on_lists(self.__load)
+
+    def __load(self):
+        self.__emit("loading")
 
-        http = self.credentials.authorize(httplib2.Http())
-        self.service = discovery.build("gmail", "v1", http=http)
+        # Show the stored mailbox while it's being updated
+        profile = self.store.get_value("profile")
+        threads = self.store.get_thread_lists()
+        if profile is not None and threads != {}:
+            self.__emit("profile-loaded", profile)
+            self.__emit("loaded", threads, self.store.get_value("labels", []))
 
-        profile = self.service.users().getProfile(userId="me").execute()
-        self.emit("profile-loaded", profile)
+        self.__refresh()
+
+    def refresh(self):
+        self.__run_on_lists(self.__refresh)
+
+    def __refresh(self):
+        """
+        Apply the changes made since the last load, only reloading
+        everything when there is no usable historyId.
+        """
+        if self.service is None:
+            self.service = build_service(self.get_http())
+            if needs_revalidation():
+                self.__run_with_callbacks(
+                    self.__revalidate_discovery, (), lambda changed: None,
+                    lambda error: None)
+
+        history_id = self.store.get_value("historyId")
+        threads = self.store.get_thread_lists()
+
+        if history_id is not None and threads != {}:
+            try:
+                history_id = self.history.sync(threads, history_id)
+
+            except HistoryExpired:
+                pass
+
+            else:
+                self.store.set_value("historyId", history_id)
+                self.store.save_thread_lists(threads)
+                self.__emit("threads-changed", threads)
+                return
+
+        self.__full_load()
+
+    def __revalidate_discovery(self):
+        """
+        Download the discovery document in the background, and use it
+        from now on if it changed.
+        """
+        if revalidate(self.get_http()):
+            self.service = build_service(self.get_http())
+            return True
+
+        return False
+
+    def check_for_changes(self, callback, error_callback):
+        """
+        Compare the mailbox historyId with the stored one and refresh the
+        thread lists if it changed. callback gets whether something
+        changed, errors go to error_callback instead of the "error" signal.
+        """
+        self.__run_with_callbacks(
+            self.__check_for_changes, (), callback, error_callback,
+            self.__lists_pool)
+
+    def __check_for_changes(self):
+        if self.service is None:
+            return False
+
+        profile = (
+            self.service.users().getProfile(userId="me", fields="historyId")
+            .execute(http=self.get_http(), scheduler=self.scheduler)
+        )
+        if profile["historyId"] == self.store.get_value("historyId"):
+            return False
+
+        self.__refresh()
+        return True
+
+    def __full_load(self):
+
+        users = self.service.users()
+        requests = [
+            ("profile", users.getProfile(userId="me")),
+            ("labels", users.labels().list(userId="me")),
+        ]
+
+        for tab in TABS:
+            requests.append((tab, users.threads().list(
+                userId="me", labelIds=tab, maxResults=PAGE_SIZE,
+                includeSpamTrash=True)))
+
+        responses = self.execute_batch(requests)
+        self.__emit("profile-loaded", responses["profile"])
 
         threads = {}
+        page_tokens = {}
         for tab in TABS:
-            results = (
-                self.service.users().threads()
-                .list(userId="me", labelIds=tab, maxResults=25,
-                      includeSpamTrash=True).execute()
-            )
-            threads[tab] = results.get("threads", [])
-
-            for category in CATEGORIES + ["UNREAD"]:
-                if category in ["UNREAD", "STARRED", "IMPORTANT"]:
-                    query = "label:" + category
-                else:  # ["INBOX", "SPAM", "TRASH", "SENT"]
-                    query = "in:" + category
-                category_thread_ids = [item['id'] for item in (
-                    self.service.users()
-                    .threads()
-                    .list(userId="me", labelIds=tab, maxResults=25, q=query)
-                    .execute()
-                ).get("threads", [])]
-                # Add "read" field to threads
-                for thread in threads[tab]:
-                    if thread['id'] in category_thread_ids:
-                        thread[category] = True
-                    else:
-                        thread[category] = False
-        results = self.service.users().labels().list(userId='me').execute()
-        labels = results.get("labels", [])
-
-        self.emit("loaded", threads, labels)
+            threads[tab] = responses[tab].get("threads", [])
+            page_tokens[tab] = responses[tab].get("nextPageToken")
+
+        self.load_thread_labels(threads)
+
+        labels = responses["labels"].get("labels", [])
+
+        self.store.set_value("profile", responses["profile"])
+        self.store.set_value("historyId", responses["profile"]["historyId"])
+        self.store.set_value("labels", labels)
+        self.store.set_value("pageTokens", page_tokens)
+        self.store.save_thread_lists(threads)
+        self.__lists_generation += 1
+
+        self.__emit("loaded", threads, labels)
+
+    def load_more(self, tab):
+        self.__run_on_lists(self.__load_more, tab, self.__lists_generation)
+
+    def __load_more(self, tab, generation):
+        """
+        Append the next page of threads to a tab, until there are no more
+        pages or the tab holds MAX_TAB_THREADS threads. Nothing is loaded
+        if a full load replaced the lists since generation. Failures are
+        only logged, the list asked for more by itself.
+        """
+        threads = self.store.get_thread_lists().get(tab, [])
+        try:
+            loaded = self.__load_page(tab, generation, threads)
+        except Exception as e:
+            logger.warning("Loading more threads failed: %s", e)
+            loaded = False
+
+        if not loaded:
+            # Lets the list ask for more again
+            self.__emit("threads-changed", {tab: threads})
+
+    def __load_page(self, tab, generation, threads):
+        page_tokens = self.store.get_value("pageTokens", {})
+        if self.service is None or page_tokens.get(tab) is None:
+            return False
+
+        if generation != self.__lists_generation:
+            return False
+
+        if len(threads) >= MAX_TAB_THREADS:
+            return False
+
+        response = (
+            self.service.users().threads()
+            .list(userId="me", labelIds=tab, maxResults=PAGE_SIZE,
+                  includeSpamTrash=True, pageToken=page_tokens[tab])
+            .execute(http=self.get_http(), scheduler=self.scheduler,
+                     priority=PRIORITY_INTERACTIVE)
+        )
+
+        # New mail shifts the pages, so a thread can show up twice
+        known = set([thread["id"] for thread in threads])
+        page = [thread for thread in response.get("threads", [])
+                if thread["id"] not in known]
+        page = page[:MAX_TAB_THREADS - len(threads)]
+        self.load_thread_labels({tab: page})
+        threads = threads + page
+
+        page_tokens[tab] = response.get("nextPageToken")
+        self.store.set_value("pageTokens", page_tokens)
+        self.store.save_thread_lists({tab: threads})
+
+        self.__emit("threads-changed", {tab: threads})
+        return True
+
+    def load_thread_labels(self, threads):
+        """
+        Fetch the labelIds of every thread in one batched metadata pass,
+        and set the UNREAD and CATEGORIES flags on each thread from them.
+        Threads whose historyId didn't change since they were stored
+        reuse the stored labelIds.
+        """
+        users = self.service.users()
+        requests = []
+        requested = set()
+        label_ids = {}
+        for tab in threads.keys():
+            for thread in threads[tab]:
+                if thread["id"] in requested or thread["id"] in label_ids:
+                    continue
+
+                summary = self.store.get_summary(thread["id"])
+                if summary is not None and \
+                   summary["historyId"] == thread["historyId"]:
+                    label_ids[thread["id"]] = summary["labelIds"]
+                    continue
+
+                requested.add(thread["id"])
+                requests.append((thread["id"], users.threads().get(
+                    userId="me", id=thread["id"], format="minimal",
+                    fields="id,historyId,messages(id,labelIds)")))
+
+        responses = self.execute_batch(requests)
+        for threadid in responses.keys():
+            label_ids[threadid] = get_thread_label_ids(responses[threadid])
+
+        for tab in threads.keys():
+            for thread in threads[tab]:
+                set_thread_flags(thread, label_ids[thread["id"]])
+
+    def execute_batch(self, requests, ignore_missing=False, errors=None):
+        """
+        Send a list of (request_id, HttpRequest) pairs using as few
+        multipart batch calls as possible, and return a dict mapping each
+        request_id to its deserialized response. Rate limited calls are
+        retried, and all batches are paced by self.scheduler.
+
+        With ignore_missing, requests answered with a 404 are left out of
+        the result instead of raising. If errors is a dict, the failed
+        requests are put there (request_id -> exception) instead of raising.
+        """
+        responses = {}
+        failed = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                if not ignore_missing or exception.resp.status != 404:
+                    failed[request_id] = exception
+            else:
+                responses[request_id] = response
+
+        batch = self.service.new_batch_http_request(
+            callback=callback, max_batch_size=MAX_BATCH_SIZE,
+            pacer=self.scheduler)
+        for request_id, request in requests:
+            batch.add(request, request_id=request_id)
+
+        batch.execute(http=self.get_http(), num_retries=MAX_RETRIES)
+
+        if errors is not None:
+            errors.update(failed)
+        elif failed:
+            raise failed.values()[0]
+
+        return responses
 
     def request_thread(self, threadid):
+        self.__run(self.__request_thread, threadid)
+
+    def __request_thread(self, threadid):
         if self.service is None:
             return
 
-        self.emit("loading")
+        self.__emit("loading")
 
-        thread = (
-            self.service.users().threads()
-            .get(userId="me", id=threadid).execute()
-        )
-        self.service.users().threads().modify(
-            userId='me',
-            id=threadid,
-            body={'removeLabelIds': ['UNREAD']}
-        ).execute()
-        self.emit("thread-loaded", thread)
+        thread = self.__get_cached_thread(threadid)
+        if thread is None:
+            thread = (
+                self.service.users().threads()
+                .get(userId="me", id=threadid)
+                .execute(http=self.get_http(), scheduler=self.scheduler,
+                         priority=PRIORITY_INTERACTIVE)
+            )
+            self.__cache_thread(thread)
+
+        self.__emit("thread-loaded", thread)
+
+        if "UNREAD" in get_thread_label_ids(thread):
+            self.label_queue.change(threadid, "UNREAD", False)
+
+    def __get_thread_key(self, threadid):
+        summary = self.store.get_summary(threadid)
+        if summary is None:
+            return None
+
+        return (threadid, summary["historyId"])
+
+    def __get_cached_thread(self, threadid):
+        """
+        Return a full thread from memory or from the store, without
+        touching the network.
+        """
+        key = self.__get_thread_key(threadid)
+        thread = self.thread_cache.get(key)
+        if thread is None:
+            thread = self.store.get_thread(threadid)
+            if thread is not None and key is not None:
+                self.thread_cache.set(key, thread)
+
+        return thread
+
+    def __cache_thread(self, thread):
+        self.store.save_thread(thread)
+        self.thread_cache.set((thread["id"], thread["historyId"]), thread)
+
+    def __forget_cached_thread(self, threadid):
+        key = self.__get_thread_key(threadid)
+        if key is not None:
+            self.thread_cache.remove(key)
+
+    def prefetch(self, threadids):
+        # Prefetching starts by itself, so its failures are only logged
+        # instead of emitting "error"
+        self.__run_with_callbacks(
+            self.__prefetch, (threadids,), lambda result: None,
+            self.__prefetch_error_cb)
+
+    def __prefetch_error_cb(self, error):
+        logger.warning("Prefetching threads failed: %s", error)
+
+    def __prefetch(self, threadids):
+        """
+        Download in the background the full threads that aren't stored
+        yet, so opening them doesn't wait for the network. Full threads
+        can be large, so they are fetched side by side on pooled
+        connections rather than in one batch. Threads that fail are left
+        to be fetched when opened, the ones another prefetch is already
+        downloading are skipped.
+        """
+        if self.service is None:
+            return
 
-    def set_star(self, threadid, starred):
-        thread = (
-            self.service.users().threads()
-            .get(userId="me", id=threadid).execute()
-        )
+        missing = [threadid for threadid in threadids
+                   if not self.store.has_thread(threadid)]
+        with self.__prefetch_lock:
+            missing = [threadid for threadid in missing
+                       if threadid not in self.__prefetching]
+            self.__prefetching.update(missing)
 
-        if starred:
-            self.service.users().threads().modify(
-                userId='me',
-                id=threadid,
-                body={'addLabelIds': ['STARRED']}
-            ).execute()
-        else:
-            self.service.users().threads().modify(
-                userId='me',
-                id=threadid,
-                body={'removeLabelIds': ['STARRED']}
-            ).execute()
+        if missing == []:
+            return
+
+        https = []
+
+        def http_factory():
+            http = self.__take_prefetch_http()
+            https.append(http)
+            return http
+
+        users = self.service.users()
+        parallel = ParallelHttpRequest(
+            http_factory=http_factory, max_workers=PARALLEL_FETCHES,
+            scheduler=self.scheduler)
+        for threadid in missing:
+            parallel.add(users.threads().get(userId="me", id=threadid),
+                         request_id=threadid)
+
+        failed = {}
+        try:
+            for threadid, thread, exception in parallel.execute():
+                if exception is None:
+                    self.__cache_thread(thread)
+                elif not isinstance(exception, HttpError):
+                    failed[threadid] = exception
+                elif exception.resp.status != 404:
+                    failed[threadid] = exception
+
+            # Every result is in, so the workers are done with their Http
+            with self.__prefetch_lock:
+                self.__prefetch_https.extend(https)
+
+        finally:
+            with self.__prefetch_lock:
+                self.__prefetching.difference_update(missing)
+
+        if failed:
+            logger.warning("Prefetching %d threads failed: %s", len(failed),
+                           failed.values()[0])
+
+    def set_star(self, threadid, starred):
+        # Called from the UI, which had the star in the opposite state
+        self.label_queue.change(threadid, "STARRED", starred,
+                                current=not starred)
+
+    def apply_labels(self, threadid, add=[], remove=[]):
+        """
+        Change the labels of the local copy of a thread, and show it.
+        """
+        self.__run_on_lists(self.__apply_labels, threadid, add, remove)
+
+    def __apply_labels(self, threadid, add, remove):
+        self.__forget_cached_thread(threadid)
+        self.store.set_thread_labels(threadid, add, remove)
+        self.__emit("threads-changed", self.store.get_thread_lists())
+
+    def modify_labels(self, changes, callback, error_callback):
+        """
+        Send {thread id: (labels to add, labels to remove)} to Gmail in
+        batches. callback gets the ids of the threads that failed.
+        """
+        self.__run_with_callbacks(
+            self.__modify_labels, (changes,), callback, error_callback)
+
+    def __modify_labels(self, changes):
+        users = self.service.users()
+        requests = []
+        for threadid, (add, remove) in changes.items():
+            requests.append((threadid, users.threads().modify(
+                userId="me", id=threadid,
+                body={"addLabelIds": add, "removeLabelIds": remove})))
+
+        errors = {}
+        self.execute_batch(requests, errors=errors)
+        return errors.keys()
 
     def start(self):
         if self.credentials is None:
@@ -147,17 +626,24 @@ class Client(GObject.GObject):
             #    self.emit("error")
 
     def send(self, mail):
+        self.__run(self.__send, mail)
+
+    def __send(self, mail):
         if self.service is None:
             return
 
         new_data = (
             self.service.users().messages()
-            .send(userId="me", body=mail).execute()
+            .send(userId="me", body=mail, fields="id,threadId")
+            .execute(http=self.get_http(), scheduler=self.scheduler,
+                     priority=PRIORITY_INTERACTIVE)
         )
-        self.emit("mail-sent", new_data)
+        self.__forget_cached_thread(new_data["threadId"])
+        self.store.drop_thread(new_data["threadId"])
+        self.__emit("mail-sent", new_data)
 
     def get_credentials(self):
-        self.__storage = Storage(CREDENTIALS_FILE)
+        self.__storage = CachedFileStorage(CREDENTIALS_FILE)
         self.credentials = self.__storage.get()
 
         if not self.credentials or self.credentials.invalid:
@@ -168,7 +654,16 @@ class Client(GObject.GObject):
             self.__run_flow()
 
         else:
-            self.emit("logged")
+            self.__logged()
+
+    def __logged(self):
+        # Keep the access token fresh, so calls don't wait for a refresh
+        if self.__refresh_timer is not None:
+            self.__refresh_timer.stop()
+
+        self.__refresh_timer = RefreshTimer(self.credentials)
+        self.__refresh_timer.start()
+        self.emit("logged")
 
     def __run_flow(self):
         success = False
@@ -201,7 +696,7 @@ class Client(GObject.GObject):
             self.__storage.put(self.credentials)
             self.credentials.set_store(self.__storage)
 
-            self.emit("logged")
+            self.__logged()
 
         except client.FlowExchangeError as e:
             self.emit("error")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import json
+import time
+import tempfile
+
+import uritemplate
+
+from googleapiclient import discovery
+
+DISCOVERY_URL = uritemplate.expand(
+    discovery.DISCOVERY_URI, {"api": "gmail", "apiVersion": "v1"})
+# Last downloaded copy of the discovery document, and the one shipped with
+# the activity, used until the first download succeeds
+CACHE_FILE = os.path.expanduser("~/.gmail-discovery.json")
+BUNDLED_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "gmail-discovery.json")
+# Seconds before the cached copy is checked against the server again
+MAX_AGE = 60 * 60 * 24
+
+
+def get_document():
+    """
+    Return the discovery document of the Gmail API without using the
+    network.
+    """
+    for path in [CACHE_FILE, BUNDLED_FILE]:
+        try:
+            with open(path) as file:
+                return file.read()
+
+        except IOError:
+            continue
+
+    return None
+
+
+def replace_file(path, write):
+    """
+    Replace the file at path with what write(file) writes. It's written to
+    a temporary file first, so a crash never leaves half a file behind,
+    and the temporary file is removed if writing fails.
+    """
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+
+        os.rename(temp, path)
+
+    except Exception:
+        os.unlink(temp)
+        raise
+
+
+def needs_revalidation():
+    try:
+        age = time.time() - os.path.getmtime(CACHE_FILE)
+    except OSError:
+        return True
+
+    return age >= MAX_AGE
+
+
+def revalidate(http):
+    """
+    Download the discovery document and keep it if its revision changed.
+    Returns True if the cached document was replaced.
+    """
+    content = discovery._retrieve_discovery_doc(
+        DISCOVERY_URL, http, cache_discovery=False)
+    if isinstance(content, unicode):
+        content = content.encode("utf-8")
+
+    revision = json.loads(content).get("revision")
+    old_revision = None
+    old_content = get_document()
+    if old_content is not None:
+        old_revision = json.loads(old_content).get("revision")
+
+    if revision == old_revision and os.path.exists(CACHE_FILE):
+        # Still up to date, check again in MAX_AGE seconds
+        os.utime(CACHE_FILE, None)
+        return False
+
+    replace_file(CACHE_FILE, lambda file: file.write(content))
+    return revision != old_revision
+
+
+def build_service(http):
+    """
+    Build the Gmail service from the cached or bundled discovery document.
+    """
+    return discovery.build_from_document(get_document(), http=http)
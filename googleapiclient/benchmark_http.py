@@ -0,0 +1,93 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the multipart encoding and decoding of BatchHttpRequest.
+
+Times the serialization of the parts of a batch, and a whole batch round
+trip against a canned response, without touching the network:
+
+  python -m googleapiclient.benchmark_http [parts]
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import sys
+import timeit
+
+from googleapiclient.benchmark_model import sample_thread
+from googleapiclient.http import BatchHttpRequest
+from googleapiclient.http import HttpMockSequence
+from googleapiclient.http import HttpRequest
+from googleapiclient.model import JsonModel
+
+BATCH_PARTS = 100
+REPEAT = 5
+BOUNDARY = 'batch_benchmark_boundary'
+
+
+def _batch_response(parts, payload):
+  """Returns the headers and content of a batch response with parts parts."""
+  lines = []
+  for i in range(parts):
+    lines.extend([
+        '--' + BOUNDARY,
+        'Content-Type: application/http',
+        'Content-ID: <response-benchmark+%d>' % (i + 1),
+        '',
+        'HTTP/1.1 200 OK',
+        'Content-Type: application/json; charset=UTF-8',
+        'Content-Length: %d' % len(payload),
+        '',
+        payload,
+    ])
+  lines.append('--' + BOUNDARY + '--')
+  headers = {'status': '200',
+             'content-type': 'multipart/mixed; boundary=' + BOUNDARY}
+  return headers, '\r\n'.join(lines)
+
+
+def _requests(parts):
+  model = JsonModel()
+  return [HttpRequest(None, model.response,
+                      'https://www.googleapis.com/gmail/v1/users/me/threads/'
+                      '15a1b2c3d4e5f6%02x?alt=json' % i,
+                      headers={'accept': 'application/json'})
+          for i in range(parts)]
+
+
+def main(parts=BATCH_PARTS):
+  requests = _requests(parts)
+  response = _batch_response(parts, json.dumps(sample_thread(messages=1)))
+
+  batch = BatchHttpRequest(batch_uri='https://www.googleapis.com/batch')
+
+  def serialize():
+    for request in requests:
+      batch._serialize_request(request)
+
+  def execute():
+    batch = BatchHttpRequest(callback=lambda *args: None,
+                             batch_uri='https://www.googleapis.com/batch')
+    for request in requests:
+      batch.add(request)
+    batch.execute(http=HttpMockSequence([response]))
+
+  for name, func in [('serialize', serialize), ('execute', execute)]:
+    seconds = min(timeit.repeat(func, number=1, repeat=REPEAT))
+    print('%-10s %d parts: %.2f ms' % (name, parts, seconds * 1000))
+
+
+if __name__ == '__main__':
+  main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,118 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks JsonModel.deserialize with each available JSON decoder.
+
+Decodes the recorded response bodies given on the command line, or a
+generated full-format Gmail thread if there are none:
+
+  python -m googleapiclient.benchmark_model [payload.json ...]
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import base64
+import importlib
+import json
+import os
+import sys
+import timeit
+
+from googleapiclient import model
+
+NUMBER = 50
+REPEAT = 5
+
+
+def sample_thread(messages=15, html_size=20000, text_size=4000):
+  """Returns a thread like the ones users.threads.get returns in full format.
+
+  Args:
+    messages: int, the number of messages in the thread.
+    html_size: int, the size in bytes of the html part of each message.
+    text_size: int, the size in bytes of the text part of each message.
+
+  Returns:
+    A dict, the deserialized thread.
+  """
+  def part(part_id, mime_type, size):
+    data = base64.urlsafe_b64encode(os.urandom(size)).decode('ascii')
+    return {
+        'partId': part_id,
+        'mimeType': mime_type,
+        'filename': '',
+        'headers': [{'name': 'Content-Type',
+                     'value': mime_type + '; charset=UTF-8'}],
+        'body': {'size': size, 'data': data},
+    }
+
+  thread_id = '15a1b2c3d4e5f600'
+  thread = {'id': thread_id, 'historyId': '2000', 'messages': []}
+  for i in range(messages):
+    thread['messages'].append({
+        'id': '15a1b2c3d4e5f6%02x' % i,
+        'threadId': thread_id,
+        'labelIds': ['INBOX', 'UNREAD', 'CATEGORY_PERSONAL'],
+        'snippet': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit',
+        'historyId': str(1000 + i),
+        'internalDate': '1476000000000',
+        'sizeEstimate': html_size + text_size,
+        'payload': {
+            'partId': '',
+            'mimeType': 'multipart/alternative',
+            'filename': '',
+            'headers': [{'name': 'X-Header-%d' % n, 'value': 'v' * 60}
+                        for n in range(25)],
+            'body': {'size': 0},
+            'parts': [part('0', 'text/plain', text_size),
+                      part('1', 'text/html', html_size)],
+        },
+    })
+  return thread
+
+
+def decoders():
+  """Returns (name, decoder) pairs for the installed JSON libraries."""
+  found = [('json', model._stdlib_loads)]
+  for name in model.FAST_JSON_MODULES:
+    try:
+      found.append((name, importlib.import_module(name).loads))
+    except ImportError:
+      pass
+  return found
+
+
+def main(paths):
+  payloads = []
+  for path in paths:
+    with open(path, 'rb') as f:
+      payloads.append(f.read())
+  if not payloads:
+    payloads.append(json.dumps(sample_thread()).encode('utf-8'))
+
+  size = sum(len(payload) for payload in payloads)
+  print('%d payloads, %d KB' % (len(payloads), size // 1024))
+  for name, decoder in decoders():
+    json_model = model.JsonModel(decoder=decoder)
+
+    def deserialize():
+      for payload in payloads:
+        json_model.deserialize(payload)
+
+    seconds = min(timeit.repeat(deserialize, number=NUMBER, repeat=REPEAT))
+    print('%-8s %.2f ms' % (name, seconds / NUMBER * 1000))
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
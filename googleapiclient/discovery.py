@@ -64,6 +64,7 @@ from googleapiclient.http import BatchHttpRequest
 from googleapiclient.http import HttpMock
 from googleapiclient.http import HttpMockSequence
 from googleapiclient.http import HttpRequest
+from googleapiclient.http import MAX_BATCH_SIZE
 from googleapiclient.http import MediaFileUpload
 from googleapiclient.http import MediaUpload
 from googleapiclient.model import JsonModel
@@ -692,6 +693,26 @@ def createMethod(methodName, methodDesc, rootDesc, schema):
     rootDesc: object, the entire deserialized discovery document.
     schema: object, mapping of schema names to schema descriptions.
   """
+  methodName, method, get_doc = _create_method(
+      methodName, methodDesc, rootDesc, schema)
+  setattr(method, '__doc__', get_doc())
+  return (methodName, method)
+
+
+def _create_method(methodName, methodDesc, rootDesc, schema):
+  """Creates a method for attaching to a Resource, without its docstring.
+
+  Args:
+    methodName: string, name of the method to use.
+    methodDesc: object, fragment of deserialized discovery document that
+      describes the method.
+    rootDesc: object, the entire deserialized discovery document.
+    schema: object, mapping of schema names to schema descriptions.
+
+  Returns:
+    Tuple (methodName, method, get_doc) where get_doc is a callable that
+    returns the docstring of the method.
+  """
   methodName = fix_method_name(methodName)
   (pathUrl, httpMethod, methodId, accept,
    maxSize, mediaPathUrl) = _fix_up_method_description(methodDesc, rootDesc)
@@ -859,6 +880,54 @@ def createMethod(methodName, methodDesc, rootDesc, schema):
                                 methodId=methodId,
                                 resumable=resumable)
 
+  def get_doc():
+    return _method_doc(methodName, methodDesc, rootDesc, schema, parameters)
+
+  return (methodName, method, get_doc)
+
+
+class _LazyDocMethod(object):
+  """A method bound to a Resource whose docstring is generated on first use.
+
+  Generating docstrings means pretty printing the schemas of the method, so
+  it's only done if something (like help()) asks for it.
+  """
+
+  def __init__(self, method, get_doc):
+    """Constructor for a _LazyDocMethod.
+
+    Args:
+      method: the bound method to call.
+      get_doc: callable, returns the docstring of the method.
+    """
+    self._method = method
+    self._get_doc = get_doc
+    self._doc = None
+
+  def __call__(self, *args, **kwargs):
+    return self._method(*args, **kwargs)
+
+  @property
+  def __doc__(self):
+    if self._doc is None:
+      self._doc = self._get_doc()
+    return self._doc
+
+
+def _method_doc(methodName, methodDesc, rootDesc, schema, parameters):
+  """Generates the docstring of a method.
+
+  Args:
+    methodName: string, the fixed name of the method.
+    methodDesc: object, fragment of deserialized discovery document that
+      describes the method.
+    rootDesc: object, the entire deserialized discovery document.
+    schema: object, mapping of schema names to schema descriptions.
+    parameters: ResourceMethodParameters, the parameters of the method.
+
+  Returns:
+    The docstring, as a string.
+  """
   docs = [methodDesc.get('description', DEFAULT_METHOD_DOC), '\n\n']
   if len(parameters.argmap) > 0:
     docs.append('Args:\n')
@@ -912,8 +981,7 @@ def createMethod(methodName, methodDesc, rootDesc, schema):
       docs.append('\nReturns:\n  An object of the form:\n\n    ')
       docs.append(schema.prettyPrintSchema(methodDesc['response']))
 
-  setattr(method, '__doc__', ''.join(docs))
-  return (methodName, method)
+  return ''.join(docs)
 
 
 def createNextMethod(methodName):
@@ -1032,6 +1100,11 @@ class Resource(object):
     self._set_service_methods()
 
   def _set_service_methods(self):
+    # Nested resources are built on first use and then reused. Being a
+    # dynamic attribute, the cache is left out when pickling.
+    self._set_dynamic_attr('_nested_resources', {})
+    # Methods that haven't been created yet, see __getattr__.
+    self._set_dynamic_attr('_lazy_methods', {})
     self._add_basic_methods(self._resourceDesc, self._rootDesc, self._schema)
     self._add_nested_resources(self._resourceDesc, self._rootDesc, self._schema)
     self._add_next_methods(self._resourceDesc, self._schema)
@@ -1041,7 +1114,8 @@ class Resource(object):
     if resourceDesc == rootDesc:
       batch_uri = '%s%s' % (
         rootDesc['rootUrl'], rootDesc.get('batchPath', 'batch'))
-      def new_batch_http_request(callback=None):
+      def new_batch_http_request(callback=None,
+                                 max_batch_size=MAX_BATCH_SIZE, pacer=None):
         """Create a BatchHttpRequest object based on the discovery document.
 
         Args:
@@ -1051,27 +1125,54 @@ class Resource(object):
             third is an apiclient.errors.HttpError exception object if an HTTP
             error occurred while processing the request, or None if no error
             occurred.
+          max_batch_size: int, the most requests sent in one batch request.
+          pacer: TokenBucket, paces the requests sent, see BatchHttpRequest.
 
         Returns:
           A BatchHttpRequest object based on the discovery document.
         """
-        return BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+        return BatchHttpRequest(callback=callback, batch_uri=batch_uri,
+                                max_batch_size=max_batch_size, pacer=pacer)
       self._set_dynamic_attr('new_batch_http_request', new_batch_http_request)
 
-    # Add basic methods to Resource
+    # Add basic methods to Resource. They are created by __getattr__ the
+    # first time they are used.
     if 'methods' in resourceDesc:
       for methodName, methodDesc in six.iteritems(resourceDesc['methods']):
-        fixedMethodName, method = createMethod(
-            methodName, methodDesc, rootDesc, schema)
-        self._set_dynamic_attr(fixedMethodName,
-                               method.__get__(self, self.__class__))
+        self._lazy_methods[fix_method_name(methodName)] = (
+            methodName, methodDesc)
         # Add in _media methods. The functionality of the attached method will
         # change when it sees that the method name ends in _media.
         if methodDesc.get('supportsMediaDownload', False):
-          fixedMethodName, method = createMethod(
-              methodName + '_media', methodDesc, rootDesc, schema)
-          self._set_dynamic_attr(fixedMethodName,
-                                 method.__get__(self, self.__class__))
+          self._lazy_methods[fix_method_name(methodName + '_media')] = (
+              methodName + '_media', methodDesc)
+
+  def __getattr__(self, name):
+    """Creates a basic method the first time it is accessed.
+
+    Args:
+      name: string, name of the attribute.
+
+    Returns:
+      The method bound to this Resource, which is then kept as a dynamic
+      attribute so it isn't created again.
+
+    Raises:
+      AttributeError if name isn't a method of this Resource.
+    """
+    # Use __dict__ directly, this can be called before __init__ or
+    # __setstate__ have set _lazy_methods.
+    lazy_methods = self.__dict__.get('_lazy_methods', {})
+    if name not in lazy_methods:
+      raise AttributeError(
+          "'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    methodName, methodDesc = lazy_methods[name]
+    fixedMethodName, method, get_doc = _create_method(
+        methodName, methodDesc, self._rootDesc, self._schema)
+    method = _LazyDocMethod(method.__get__(self, self.__class__), get_doc)
+    self._set_dynamic_attr(fixedMethodName, method)
+    return method
 
   def _add_nested_resources(self, resourceDesc, rootDesc, schema):
     # Add in nested resources
@@ -1088,11 +1189,16 @@ class Resource(object):
         methodName = fix_method_name(methodName)
 
         def methodResource(self):
-          return Resource(http=self._http, baseUrl=self._baseUrl,
-                          model=self._model, developerKey=self._developerKey,
-                          requestBuilder=self._requestBuilder,
-                          resourceDesc=methodDesc, rootDesc=rootDesc,
-                          schema=schema)
+          resource = self._nested_resources.get(methodName)
+          if resource is None:
+            resource = Resource(http=self._http, baseUrl=self._baseUrl,
+                                model=self._model,
+                                developerKey=self._developerKey,
+                                requestBuilder=self._requestBuilder,
+                                resourceDesc=methodDesc, rootDesc=rootDesc,
+                                schema=schema)
+            self._nested_resources[methodName] = resource
+          return resource
 
         setattr(methodResource, '__doc__', 'A collection resource.')
         setattr(methodResource, '__is_resource__', True)
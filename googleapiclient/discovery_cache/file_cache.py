@@ -12,130 +12,121 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""File based cache for the discovery document.
-
-The cache is stored in a single file so that multiple processes can
-share the same cache. It locks the file whenever accesing to the
-file. When the cache content is corrupted, it will be initialized with
-an empty cache.
+"""File based cache for the discovery documents.
+
+Each document is stored in its own file, named after a hash of its URL, in a
+directory shared by all the processes using the cache. A lookup only opens
+the file of the requested document, so it costs the same however many
+documents are cached. Files are replaced atomically by renaming a temporary
+file over them, so no locking is needed. Expired entries are deleted when
+they are next looked up.
 """
 
 from __future__ import division
 
-import datetime
-import json
+import hashlib
+import io
 import logging
 import os
 import tempfile
-import threading
-
-try:
-  from oauth2client.contrib.locked_file import LockedFile
-except ImportError:
-  # oauth2client < 2.0.0
-  try:
-    from oauth2client.locked_file import LockedFile
-  except ImportError:
-    # oauth2client > 4.0.0
-    raise ImportError(
-      'file_cache is unavailable when using oauth2client >= 4.0.0')
+import time
 
 from . import base
 from ..discovery_cache import DISCOVERY_DOC_MAX_AGE
 
 LOGGER = logging.getLogger(__name__)
 
-FILENAME = 'google-api-python-client-discovery-doc.cache'
-EPOCH = datetime.datetime.utcfromtimestamp(0)
+DIRNAME = 'google-api-python-client-discovery-doc.cache.d'
 
 
-def _to_timestamp(date):
-  try:
-    return (date - EPOCH).total_seconds()
-  except AttributeError:
-    # The following is the equivalent of total_seconds() in Python2.6.
-    # See also: https://docs.python.org/2/library/datetime.html
-    delta = date - EPOCH
-    return ((delta.microseconds + (delta.seconds + delta.days * 24 * 3600)
-             * 10**6) / 10**6)
+def _entry_name(url):
+  """Returns the file name of the cache entry for url."""
+  return hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json'
+
 
+def _read_entry(path):
+  """Reads a cache entry.
 
-def _read_or_initialize_cache(f):
-  f.file_handle().seek(0)
+  An entry is a header line with the time it was written and its URL,
+  followed by the document.
+
+  Returns:
+    A tuple (timestamp, url, content), or None if the entry doesn't exist.
+  """
+  try:
+    with io.open(path, 'r', encoding='utf-8', newline='') as f:
+      header = f.readline()
+      timestamp, url = header.rstrip('\n').split(' ', 1)
+      return float(timestamp), url, f.read()
+  except (IOError, OSError):
+    return None
+
+
+def _write_entry(path, url, content):
+  """Atomically replaces the cache entry at path."""
+  directory = os.path.dirname(path)
+  fd, temp = tempfile.mkstemp(prefix='.', dir=directory)
   try:
-    cache = json.load(f.file_handle())
+    with io.open(fd, 'w', encoding='utf-8', newline='') as f:
+      f.write(u'%r %s\n' % (time.time(), url))
+      f.write(content)
+    try:
+      os.rename(temp, path)
+    except OSError:
+      # Windows doesn't rename over an existing file.
+      os.remove(path)
+      os.rename(temp, path)
   except Exception:
-    # This means it opens the file for the first time, or the cache is
-    # corrupted, so initializing the file with an empty dict.
-    cache = {}
-    f.file_handle().truncate(0)
-    f.file_handle().seek(0)
-    json.dump(cache, f.file_handle())
-  return cache
+    os.remove(temp)
+    raise
 
 
 class Cache(base.Cache):
   """A file based cache for the discovery documents."""
 
-  def __init__(self, max_age):
-      """Constructor.
-
-      Args:
-        max_age: Cache expiration in seconds.
-      """
-      self._max_age = max_age
-      self._file = os.path.join(tempfile.gettempdir(), FILENAME)
-      f = LockedFile(self._file, 'a+', 'r')
-      try:
-        f.open_and_lock()
-        if f.is_locked():
-          _read_or_initialize_cache(f)
-        # If we can not obtain the lock, other process or thread must
-        # have initialized the file.
-      except Exception as e:
-        LOGGER.warning(e, exc_info=True)
-      finally:
-        f.unlock_and_close()
+  def __init__(self, max_age, directory=None):
+    """Constructor.
+
+    Args:
+      max_age: Cache expiration in seconds.
+      directory: string, the directory to keep the entries in. Defaults to
+        one in the temporary directory.
+    """
+    self._max_age = max_age
+    if directory is None:
+      directory = os.path.join(tempfile.gettempdir(), DIRNAME)
+    self._directory = directory
+    try:
+      os.makedirs(self._directory)
+    except OSError:
+      # It exists already, or can't be created, in which case get() and
+      # set() will log why.
+      pass
 
   def get(self, url):
-    f = LockedFile(self._file, 'r+', 'r')
+    path = os.path.join(self._directory, _entry_name(url))
     try:
-      f.open_and_lock()
-      if f.is_locked():
-        cache = _read_or_initialize_cache(f)
-        if url in cache:
-          content, t = cache.get(url, (None, 0))
-          if _to_timestamp(datetime.datetime.now()) < t + self._max_age:
-            return content
+      entry = _read_entry(path)
+      if entry is None:
+        return None
+      timestamp, entry_url, content = entry
+      if entry_url != url:
         return None
-      else:
-        LOGGER.debug('Could not obtain a lock for the cache file.')
+      if time.time() >= timestamp + self._max_age:
+        os.remove(path)
         return None
+      return content
     except Exception as e:
       LOGGER.warning(e, exc_info=True)
-    finally:
-      f.unlock_and_close()
 
   def set(self, url, content):
-    f = LockedFile(self._file, 'r+', 'r')
+    if isinstance(content, bytes):
+      content = content.decode('utf-8')
+    path = os.path.join(self._directory, _entry_name(url))
     try:
-      f.open_and_lock()
-      if f.is_locked():
-        cache = _read_or_initialize_cache(f)
-        cache[url] = (content, _to_timestamp(datetime.datetime.now()))
-        # Remove stale cache.
-        for k, (_, timestamp) in list(cache.items()):
-          if _to_timestamp(datetime.datetime.now()) >= timestamp + self._max_age:
-            del cache[k]
-        f.file_handle().truncate(0)
-        f.file_handle().seek(0)
-        json.dump(cache, f.file_handle())
-      else:
-        LOGGER.debug('Could not obtain a lock for the cache file.')
+      _write_entry(path, url, content)
     except Exception as e:
       LOGGER.warning(e, exc_info=True)
-    finally:
-      f.unlock_and_close()
 
 
 cache = Cache(max_age=DISCOVERY_DOC_MAX_AGE)
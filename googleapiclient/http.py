@@ -21,17 +21,20 @@ actuall HTTP request.
 from __future__ import absolute_import
 import six
 from six.moves import http_client
+from six.moves import queue
 from six.moves import range
 
 __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 
-from six import BytesIO, StringIO
+from six import BytesIO
 from six.moves.urllib.parse import urlparse, urlunparse, quote, unquote
 
 import base64
 import copy
 import gzip
+import heapq
 import httplib2
+import itertools
 import json
 import logging
 import mimetypes
@@ -39,6 +42,7 @@ import os
 import random
 import socket
 import sys
+import threading
 import time
 import uuid
 
@@ -50,11 +54,6 @@ except ImportError:
 else:
   _ssl_SSLError = ssl.SSLError
 
-from email.generator import Generator
-from email.mime.multipart import MIMEMultipart
-from email.mime.nonmultipart import MIMENonMultipart
-from email.parser import FeedParser
-
 # Oauth2client < 3 has the positional helper in 'util', >= 3 has it
 # in '_helpers'.
 try:
@@ -62,6 +61,12 @@ try:
 except ImportError:
   from oauth2client import _helpers as util
 
+# Oauth2client >= 4 can share a refresh between concurrent callers.
+try:
+  from oauth2client.transport import refresh_once
+except ImportError:
+  refresh_once = None
+
 from googleapiclient import mimeparse
 from googleapiclient.errors import BatchError
 from googleapiclient.errors import HttpError
@@ -78,6 +83,13 @@ DEFAULT_CHUNK_SIZE = 512*1024
 
 MAX_URI_LENGTH = 2048
 
+# The most calls the server accepts in one batch request.
+MAX_BATCH_SIZE = 1000
+
+# QuotaScheduler priorities, lower values are admitted first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
 _TOO_MANY_REQUESTS = 429
 
 
@@ -124,6 +136,22 @@ def _should_retry_response(resp_status, content):
   return False
 
 
+def _refresh_credentials(credentials, http, stale_token=None):
+  """Refreshes credentials, sharing the refresh with concurrent callers.
+
+  Args:
+    credentials: Credentials, the credentials to refresh.
+    http: httplib2.Http, the http object the credentials authorize.
+    stale_token: string, the access token that was found not to work, or None
+      if there was no token. The refresh is skipped if the credentials hold a
+      different token already.
+  """
+  if refresh_once is None:
+    credentials.refresh(http)
+  else:
+    refresh_once(credentials, http.request, stale_token)
+
+
 def _retry_request(http, num_retries, req_type, sleep, rand, uri, method, *args,
                    **kwargs):
   """Retries an HTTP request multiple times while handling errors.
@@ -782,7 +810,8 @@ class HttpRequest(object):
     self._sleep = time.sleep
 
   @util.positional(1)
-  def execute(self, http=None, num_retries=0):
+  def execute(self, http=None, num_retries=0, scheduler=None,
+              priority=PRIORITY_BACKGROUND):
     """Execute the request.
 
     Args:
@@ -792,6 +821,9 @@ class HttpRequest(object):
             exponential backoff. If all retries fail, the raised HttpError
             represents the last request. If zero (default), we attempt the
             request only once.
+      scheduler: TokenBucket, if given every attempt at sending the request
+            first waits for the scheduler to admit it.
+      priority: int, the priority passed to the scheduler.
 
     Returns:
       A deserialized object model of the response body as determined
@@ -827,6 +859,9 @@ class HttpRequest(object):
       self.body = parsed.query
       self.headers['content-length'] = str(len(self.body))
 
+    if scheduler is not None:
+      http = _ScheduledHttp(http, scheduler, scheduler.cost(self), priority)
+
     # Handle retries for server-side errors.
     resp, content = _retry_request(
           http, num_retries, 'request', self._sleep, self._rand, str(self.uri),
@@ -1035,6 +1070,281 @@ class HttpRequest(object):
         resumable=d['resumable'])
 
 
+class TokenBucket(object):
+  """Paces requests to a sustained rate, allowing short bursts.
+
+  A bucket can be shared by any number of threads and batches, so that
+  together they stay under a quota.
+
+  Example:
+    pacer = TokenBucket(25)
+    batch = BatchHttpRequest(pacer=pacer)
+  """
+
+  def __init__(self, rate, capacity=None):
+    """Constructor for a TokenBucket.
+
+    Args:
+      rate: float, tokens added per second, the sustained rate.
+      capacity: float, the most tokens that can accumulate, the largest
+        burst. Defaults to one second worth of tokens.
+    """
+    self.rate = float(rate)
+    self.capacity = float(capacity or rate)
+    self._tokens = self.capacity
+    self._updated = time.time()
+    self._lock = threading.Lock()
+
+    # Stubs for testing.
+    self._sleep = time.sleep
+
+  def consume(self, tokens=1, priority=PRIORITY_BACKGROUND):
+    """Takes tokens from the bucket, waiting until they are available.
+
+    Asking for more tokens than the capacity is allowed, the caller then
+    waits until the bucket has refilled enough to pay for them.
+
+    Args:
+      tokens: float, the number of tokens to take.
+      priority: int, ignored, a TokenBucket serves callers in order.
+
+    Returns:
+      The number of seconds waited.
+    """
+    with self._lock:
+      self._refill()
+      # Take the tokens now, even if that leaves the bucket in debt, so
+      # that waiters are served in order.
+      self._tokens -= tokens
+      wait = max(0, -self._tokens / self.rate)
+    if wait > 0:
+      self._sleep(wait)
+    return wait
+
+  def cost(self, request):
+    """Returns the number of tokens sending request takes.
+
+    Args:
+      request: HttpRequest, the request about to be sent.
+
+    Returns:
+      The cost of the request, always 1 for a TokenBucket.
+    """
+    return 1
+
+  def _refill(self):
+    """Adds the tokens earned since the last call, the lock must be held."""
+    now = time.time()
+    self._tokens = min(self.capacity,
+                       self._tokens + (now - self._updated) * self.rate)
+    self._updated = now
+
+
+class QuotaScheduler(TokenBucket):
+  """Admits requests against a quota measured in units per second.
+
+  Each API method costs a number of quota units, looked up by the methodId of
+  the request. Requests wait until the quota allows them, and waiting
+  requests are admitted by priority, so that a PRIORITY_INTERACTIVE request
+  (e.g. one the user is waiting on) goes ahead of queued PRIORITY_BACKGROUND
+  ones. Requests of the same priority are admitted in order.
+
+  A QuotaScheduler can be passed wherever a TokenBucket is accepted, and to
+  HttpRequest.execute().
+
+  Example:
+    scheduler = QuotaScheduler(250, costs={'gmail.users.threads.get': 10})
+    thread = service.users().threads().get(userId='me', id=thread_id).execute(
+        scheduler=scheduler, priority=PRIORITY_INTERACTIVE)
+  """
+
+  def __init__(self, rate, capacity=None, costs=None, default_cost=1):
+    """Constructor for a QuotaScheduler.
+
+    Args:
+      rate: float, quota units per second.
+      capacity: float, the most units that can accumulate, the largest burst.
+        Defaults to one second worth of units.
+      costs: dict, maps methodIds to their cost in quota units.
+      default_cost: float, the cost of methods missing from costs.
+    """
+    super(QuotaScheduler, self).__init__(rate, capacity)
+    self.costs = costs or {}
+    self.default_cost = default_cost
+    self._condition = threading.Condition(self._lock)
+    # Heap of (priority, sequence number) of the waiting callers.
+    self._waiting = []
+    self._sequence = itertools.count()
+
+  def cost(self, request):
+    """Returns the quota units sending request takes.
+
+    Args:
+      request: HttpRequest, the request about to be sent.
+
+    Returns:
+      The cost of the request's method, or default_cost.
+    """
+    return self.costs.get(request.methodId, self.default_cost)
+
+  def consume(self, tokens=1, priority=PRIORITY_BACKGROUND):
+    """Takes quota units, waiting until they are available.
+
+    Args:
+      tokens: float, the number of quota units to take.
+      priority: int, PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND.
+
+    Returns:
+      The number of seconds waited.
+    """
+    started = time.time()
+    # A request bigger than the bucket goes when it is full, in debt.
+    needed = min(tokens, self.capacity)
+    with self._condition:
+      ticket = (priority, next(self._sequence))
+      heapq.heappush(self._waiting, ticket)
+      # A new first caller may have to go ahead of the one sleeping.
+      self._condition.notify_all()
+      try:
+        while True:
+          if self._waiting[0] == ticket:
+            self._refill()
+            if self._tokens >= needed:
+              self._tokens -= tokens
+              break
+            self._condition.wait((needed - self._tokens) / self.rate)
+          else:
+            self._condition.wait()
+      finally:
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+        self._condition.notify_all()
+    return time.time() - started
+
+  def admit(self, request, priority=PRIORITY_BACKGROUND):
+    """Waits until request can be sent, and takes its cost.
+
+    Args:
+      request: HttpRequest, the request about to be sent.
+      priority: int, PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND.
+
+    Returns:
+      The number of seconds waited.
+    """
+    return self.consume(self.cost(request), priority)
+
+  def queue_depth(self, priority=None):
+    """Returns the number of callers waiting to be admitted.
+
+    Args:
+      priority: int, if given only count the callers of that priority.
+    """
+    with self._lock:
+      if priority is None:
+        return len(self._waiting)
+      return len([ticket for ticket in self._waiting
+                  if ticket[0] == priority])
+
+
+class _ScheduledHttp(object):
+  """Wraps an http object so that every request waits for a scheduler."""
+
+  def __init__(self, http, scheduler, cost, priority):
+    self._http = http
+    self._scheduler = scheduler
+    self._cost = cost
+    self._priority = priority
+
+  def request(self, *args, **kwargs):
+    self._scheduler.consume(self._cost, self._priority)
+    return self._http.request(*args, **kwargs)
+
+
+def _new_boundary(parts):
+  """Returns a multipart boundary that doesn't occur in any of parts.
+
+  Args:
+    parts: list, the strings the boundary will separate.
+
+  Returns:
+    The boundary, as a string.
+  """
+  while True:
+    boundary = '===============%s==' % uuid.uuid4().hex
+    if not any(boundary in part for part in parts):
+      return boundary
+
+
+def _iter_multipart(content, boundary):
+  """Yields the parts of a multipart body, in order.
+
+  The body is scanned for the delimiter lines rather than handed to
+  email.parser, so no message objects are built for the parts.
+
+  Args:
+    content: string, the multipart body.
+    boundary: string, the boundary parameter of its Content-Type.
+
+  Raises:
+    googleapiclient.errors.BatchError if the body has no parts.
+  """
+  delimiter = '--' + boundary
+  start = content.find(delimiter)
+  if start == -1:
+    raise BatchError("Response not in multipart/mixed format.")
+  start += len(delimiter)
+  while not content.startswith('--', start):
+    # Skip the rest of the delimiter line.
+    start = content.find('\n', start)
+    if start == -1:
+      break
+    start += 1
+    end = content.find(delimiter, start)
+    if end == -1:
+      end = len(content)
+    # The line break before a delimiter belongs to the delimiter.
+    part_end = end
+    if content.startswith('\n', part_end - 1):
+      part_end -= 1
+      if content.startswith('\r', part_end - 1):
+        part_end -= 1
+    yield content[start:part_end]
+    start = end + len(delimiter)
+
+
+def _parse_headers(text):
+  """Splits a message into its headers and body.
+
+  Args:
+    text: string, header lines, an empty line and the body. Lines may end
+      with either CRLF or LF.
+
+  Returns:
+    A pair (headers, body) of a dict with lowercase header names and the body
+    as a string.
+  """
+  crlf = text.find('\r\n\r\n')
+  lf = text.find('\n\n')
+  if crlf != -1 and (lf == -1 or crlf < lf):
+    head, body = text[:crlf], text[crlf + 4:]
+  elif lf != -1:
+    head, body = text[:lf], text[lf + 2:]
+  else:
+    head, body = text, ''
+
+  headers = {}
+  key = None
+  for line in head.splitlines():
+    if line[:1] in (' ', '\t') and key is not None:
+      # A folded header line.
+      headers[key] += ' ' + line.strip()
+    elif ':' in line:
+      key, value = line.split(':', 1)
+      key = key.strip().lower()
+      headers[key] = value.strip()
+  return headers, body
+
+
 class BatchHttpRequest(object):
   """Batches multiple HttpRequest objects into a single HTTP request.
 
@@ -1069,7 +1379,8 @@ class BatchHttpRequest(object):
   """
 
   @util.positional(1)
-  def __init__(self, callback=None, batch_uri=None):
+  def __init__(self, callback=None, batch_uri=None,
+               max_batch_size=MAX_BATCH_SIZE, pacer=None):
     """Constructor for a BatchHttpRequest.
 
     Args:
@@ -1079,10 +1390,17 @@ class BatchHttpRequest(object):
         third is an googleapiclient.errors.HttpError exception object if an HTTP error
         occurred while processing the request, or None if no error occurred.
       batch_uri: string, URI to send batch requests to.
+      max_batch_size: int, the most requests sent in one batch request, more
+        requests are split into several batch requests.
+      pacer: TokenBucket, if given the cost of every request sent, retries
+        included, is taken from it before sending. A QuotaScheduler charges
+        the quota units of each method.
     """
     if batch_uri is None:
       batch_uri = 'https://www.googleapis.com/batch'
     self._batch_uri = batch_uri
+    self._max_batch_size = max_batch_size
+    self._pacer = pacer
 
     # Global callback to be called for each individual response in the batch.
     self._callback = callback
@@ -1108,25 +1426,43 @@ class BatchHttpRequest(object):
     # A map of id(Credentials) that have been refreshed.
     self._refreshed_credentials = {}
 
-  def _refresh_and_apply_credentials(self, request, http):
-    """Refresh the credentials and apply to the request.
+    # A map from id(Credentials) to the access token the last batch was sent
+    # with.
+    self._sent_tokens = {}
+
+    # Stubs for testing.
+    self._rand = random.random
+    self._sleep = time.sleep
+
+  def _request_credentials(self, request, http):
+    """Returns the credentials a request is authorized with, or None.
 
     Args:
       request: HttpRequest, the request.
       http: httplib2.Http, the global http object for the batch.
     """
-    # For the credentials to refresh, but only once per refresh_token
-    # If there is no http per the request then refresh the http passed in
-    # via execute()
-    creds = None
+    # If there is no http per the request then use the http passed in via
+    # execute()
     if request.http is not None and hasattr(request.http.request,
         'credentials'):
-      creds = request.http.request.credentials
+      return request.http.request.credentials
     elif http is not None and hasattr(http.request, 'credentials'):
-      creds = http.request.credentials
+      return http.request.credentials
+    return None
+
+  def _refresh_and_apply_credentials(self, request, http):
+    """Refresh the credentials and apply to the request.
+
+    Args:
+      request: HttpRequest, the request.
+      http: httplib2.Http, the global http object for the batch.
+    """
+    # For the credentials to refresh, but only once per refresh_token
+    creds = self._request_credentials(request, http)
     if creds is not None:
       if id(creds) not in self._refreshed_credentials:
-        creds.refresh(http)
+        _refresh_credentials(creds, http,
+                             self._sent_tokens.get(id(creds)))
         self._refreshed_credentials[id(creds)] = 1
 
     # Only apply the credentials if we are using the http object passed in,
@@ -1188,36 +1524,30 @@ class BatchHttpRequest(object):
     request_line = urlunparse(
         ('', '', parsed.path, parsed.params, parsed.query, '')
         )
-    status_line = request.method + ' ' + request_line + ' HTTP/1.1\n'
-    major, minor = request.headers.get('content-type', 'application/json').split('/')
-    msg = MIMENonMultipart(major, minor)
+    lines = [request.method + ' ' + request_line + ' HTTP/1.1',
+             'Content-Type: ' + request.headers.get('content-type',
+                                                    'application/json'),
+             'MIME-Version: 1.0']
     headers = request.headers.copy()
 
     if request.http is not None and hasattr(request.http.request,
         'credentials'):
       request.http.request.credentials.apply(headers)
 
-    # MIMENonMultipart adds its own Content-Type header.
+    # The Content-Type header is already written.
     if 'content-type' in headers:
       del headers['content-type']
 
     for key, value in six.iteritems(headers):
-      msg[key] = value
-    msg['Host'] = parsed.netloc
-    msg.set_unixfrom(None)
+      lines.append('%s: %s' % (key, value))
+    lines.append('Host: ' + parsed.netloc)
 
     if request.body is not None:
-      msg.set_payload(request.body)
-      msg['content-length'] = str(len(request.body))
+      lines.append('content-length: ' + str(len(request.body)))
 
-    # Serialize the mime message.
-    fp = StringIO()
-    # maxheaderlen=0 means don't line wrap headers.
-    g = Generator(fp, maxheaderlen=0)
-    g.flatten(msg, unixfrom=False)
-    body = fp.getvalue()
-
-    return status_line + body
+    lines.append('')
+    lines.append(request.body or '')
+    return '\n'.join(lines)
 
   def _deserialize_response(self, payload):
     """Convert string into httplib2 response and content.
@@ -1233,18 +1563,14 @@ class BatchHttpRequest(object):
     protocol, status, reason = status_line.split(' ', 2)
 
     # Parse the rest of the response
-    parser = FeedParser()
-    parser.feed(payload)
-    msg = parser.close()
-    msg['status'] = status
+    headers, content = _parse_headers(payload)
+    headers['status'] = status
 
     # Create httplib2.Response from the parsed headers.
-    resp = httplib2.Response(msg)
-    resp.reason = reason
+    resp = httplib2.Response(headers)
+    resp.reason = reason.rstrip('\r')
     resp.version = int(protocol.split('/', 1)[1].replace('.', ''))
 
-    content = payload.split('\r\n\r\n', 1)[1]
-
     return resp, content
 
   def _new_id(self):
@@ -1299,7 +1625,7 @@ class BatchHttpRequest(object):
     self._callbacks[request_id] = callback
     self._order.append(request_id)
 
-  def _execute(self, http, order, requests):
+  def _execute(self, http, order, requests, num_retries=0):
     """Serialize batch request, send to server, process response.
 
     Args:
@@ -1307,76 +1633,131 @@ class BatchHttpRequest(object):
       order: list, list of request ids in the order they were added to the
         batch.
       request: list, list of request objects to send.
+      num_retries: Integer, number of times to retry the batch request itself
+        with randomized exponential backoff.
 
     Raises:
       httplib2.HttpLib2Error if a transport error has occured.
       googleapiclient.errors.BatchError if the response is the wrong format.
     """
-    message = MIMEMultipart('mixed')
-    # Message should not write out it's own headers.
-    setattr(message, '_write_headers', lambda self: None)
-
     # Add all the individual requests.
+    parts = []
     for request_id in order:
       request = requests[request_id]
-
-      msg = MIMENonMultipart('application', 'http')
-      msg['Content-Transfer-Encoding'] = 'binary'
-      msg['Content-ID'] = self._id_to_header(request_id)
-
-      body = self._serialize_request(request)
-      msg.set_payload(body)
-      message.attach(msg)
-
-    # encode the body: note that we can't use `as_string`, because
-    # it plays games with `From ` lines.
-    fp = StringIO()
-    g = Generator(fp, mangle_from_=False)
-    g.flatten(message, unixfrom=False)
-    body = fp.getvalue()
+      creds = self._request_credentials(request, http)
+      if creds is not None:
+        self._sent_tokens[id(creds)] = getattr(creds, 'access_token', None)
+      parts.append('Content-Type: application/http\n'
+                   'MIME-Version: 1.0\n'
+                   'Content-Transfer-Encoding: binary\n'
+                   'Content-ID: %s\n\n' % self._id_to_header(request_id) +
+                   self._serialize_request(request))
+
+    boundary = _new_boundary(parts)
+    delimiter = '--' + boundary
+    body = (delimiter + '\n' + ('\n' + delimiter + '\n').join(parts) +
+            '\n' + delimiter + '--\n')
 
     headers = {}
     headers['content-type'] = ('multipart/mixed; '
-                               'boundary="%s"') % message.get_boundary()
+                               'boundary="%s"') % boundary
+
+    if self._pacer is not None:
+      self._pacer.consume(sum(self._pacer.cost(requests[request_id])
+                              for request_id in order))
 
-    resp, content = http.request(self._batch_uri, method='POST', body=body,
-                                 headers=headers)
+    resp, content = _retry_request(
+        http, num_retries, 'batch', self._sleep, self._rand, self._batch_uri,
+        method='POST', body=body, headers=headers)
 
     if resp.status >= 300:
       raise HttpError(resp, content, uri=self._batch_uri)
 
-    # Prepend with a content-type header so FeedParser can handle it.
-    header = 'content-type: %s\r\n\r\n' % resp['content-type']
-    # PY3's FeedParser only accepts unicode. So we should decode content
-    # here, and encode each payload again.
-    if six.PY3:
-      content = content.decode('utf-8')
-    for_parser = header + content
-
-    parser = FeedParser()
-    parser.feed(for_parser)
-    mime_response = parser.close()
-
-    if not mime_response.is_multipart():
+    major, minor, params = mimeparse.parse_mime_type(
+        resp.get('content-type', ''))
+    boundary = params.get('boundary', '').strip('"')
+    if major != 'multipart' or not boundary:
       raise BatchError("Response not in multipart/mixed format.", resp=resp,
                        content=content)
 
-    for part in mime_response.get_payload():
-      request_id = self._header_to_id(part['Content-ID'])
-      response, content = self._deserialize_response(part.get_payload())
+    # Work on text like the requests do, and encode each payload again.
+    if six.PY3:
+      content = content.decode('utf-8')
+
+    for part in _iter_multipart(content, boundary):
+      part_headers, payload = _parse_headers(part)
+      request_id = self._header_to_id(part_headers.get('content-id', ''))
+      response, content = self._deserialize_response(payload)
       # We encode content here to emulate normal http response.
       if isinstance(content, six.text_type):
         content = content.encode('utf-8')
       self._responses[request_id] = (response, content)
 
+  def _retry_failed(self, http, order, num_retries):
+    """Send again the requests of a batch that failed.
+
+    Requests answered with a 401 are sent again once, after refreshing their
+    credentials. Requests that were rate limited or hit a server error are
+    retried up to num_retries times with randomized exponential backoff,
+    waiting at least as long as any Retry-After header asks for.
+
+    Args:
+      http: httplib2.Http, the http object the batch was sent with.
+      order: list, the ids of the requests in the batch.
+      num_retries: Integer, the most times a request is retried.
+    """
+    # Loop over all the requests and check for 401s. For each 401 request the
+    # credentials should be refreshed and then sent again in a separate batch.
+    redo_requests = {}
+    redo_order = []
+
+    for request_id in order:
+      resp, content = self._responses[request_id]
+      if resp['status'] == '401':
+        redo_order.append(request_id)
+        request = self._requests[request_id]
+        self._refresh_and_apply_credentials(request, http)
+        redo_requests[request_id] = request
+
+    if redo_requests:
+      self._execute(http, redo_order, redo_requests, num_retries)
+
+    for retry_num in range(1, num_retries + 1):
+      retry_order = []
+      retry_after = 0
+      for request_id in order:
+        resp, content = self._responses[request_id]
+        if _should_retry_response(resp.status, content):
+          retry_order.append(request_id)
+          try:
+            retry_after = max(retry_after, int(resp.get('retry-after', 0)))
+          except ValueError:
+            pass
+      if not retry_order:
+        break
+
+      sleep_time = max(retry_after, self._rand() * 2 ** retry_num)
+      LOGGER.warning(
+          'Sleeping %.2f seconds before retry %d of %d for %d requests '
+          'of a batch', sleep_time, retry_num, num_retries, len(retry_order))
+      self._sleep(sleep_time)
+      self._execute(http, retry_order, self._requests, num_retries)
+
   @util.positional(1)
-  def execute(self, http=None):
-    """Execute all the requests as a single batched HTTP request.
+  def execute(self, http=None, num_retries=0):
+    """Execute all the requests as batched HTTP requests.
+
+    The requests are sent in batches of at most max_batch_size, one after the
+    other.
 
     Args:
       http: httplib2.Http, an http object to be used in place of the one the
         HttpRequest request object was constructed with. If one isn't supplied
         then use a http object from the requests in this batch.
+      num_retries: Integer, number of times to retry with randomized
+        exponential backoff. Both a failed batch request and the individual
+        requests in it that were rate limited or hit a server error are
+        retried. If zero (default), the requests are sent only once.
 
     Returns:
       None
@@ -1406,25 +1787,12 @@ class BatchHttpRequest(object):
       creds = http.request.credentials
       if not getattr(creds, 'access_token', None):
         LOGGER.info('Attempting refresh to obtain initial access_token')
-        creds.refresh(http)
+        _refresh_credentials(creds, http)
 
-    self._execute(http, self._order, self._requests)
-
-    # Loop over all the requests and check for 401s. For each 401 request the
-    # credentials should be refreshed and then sent again in a separate batch.
-    redo_requests = {}
-    redo_order = []
-
-    for request_id in self._order:
-      resp, content = self._responses[request_id]
-      if resp['status'] == '401':
-        redo_order.append(request_id)
-        request = self._requests[request_id]
-        self._refresh_and_apply_credentials(request, http)
-        redo_requests[request_id] = request
-
-    if redo_requests:
-      self._execute(http, redo_order, redo_requests)
+    for start in range(0, len(self._order), self._max_batch_size):
+      order = self._order[start:start + self._max_batch_size]
+      self._execute(http, order, self._requests, num_retries)
+      self._retry_failed(http, order, num_retries)
 
     # Now process all callbacks that are erroring, and raise an exception for
     # ones that return a non-2xx response? Or add extra parameter to callback
@@ -1451,6 +1819,153 @@ class BatchHttpRequest(object):
         self._callback(request_id, response, exception)
 
 
+class ParallelHttpRequest(object):
+  """Executes multiple HttpRequest objects concurrently.
+
+  Unlike BatchHttpRequest every request is sent on its own, but up to
+  max_workers of them are in flight at once, each on its own connection. That
+  suits requests with large responses, which a batch would have to buffer
+  and parse as a single multipart payload. Results are yielded as soon as
+  each request completes.
+
+  Example:
+    from googleapiclient.http import ParallelHttpRequest
+
+    parallel = ParallelHttpRequest(http_factory=get_http, max_workers=4)
+    for thread_id in thread_ids:
+      parallel.add(service.users().threads().get(userId='me', id=thread_id),
+                   request_id=thread_id)
+
+    for request_id, response, exception in parallel.execute():
+      if exception is not None:
+        # Do something with the exception.
+        pass
+      else:
+        # Do something with the response.
+        pass
+  """
+
+  @util.positional(1)
+  def __init__(self, http_factory=None, max_workers=4, max_per_host=None,
+               num_retries=0, scheduler=None, priority=PRIORITY_BACKGROUND):
+    """Constructor for a ParallelHttpRequest.
+
+    Args:
+      http_factory: callable, called without arguments from each worker
+        thread to get the http object to use there, since httplib2.Http
+        objects can't be shared between threads. If None, requests use
+        their own http object, which then must be safe to share.
+      max_workers: int, the most requests in flight at once.
+      max_per_host: int, the most requests in flight at once to the same
+        host. Defaults to max_workers.
+      num_retries: Integer, passed to HttpRequest.execute().
+      scheduler: TokenBucket, passed to HttpRequest.execute().
+      priority: int, passed to HttpRequest.execute().
+    """
+    self._http_factory = http_factory
+    self._max_workers = max_workers
+    self._max_per_host = max_per_host or max_workers
+    self._num_retries = num_retries
+    self._scheduler = scheduler
+    self._priority = priority
+
+    # List of (request id, request), in the order in which they were added.
+    self._requests = []
+
+    # The ids of the requests added so far.
+    self._ids = set()
+
+    # The last auto generated id.
+    self._last_auto_id = 0
+
+  def add(self, request, request_id=None):
+    """Add a new request.
+
+    Args:
+      request: HttpRequest, Request to add to the set.
+      request_id: string, A unique id for the request. If None, an id is
+        generated.
+
+    Raises:
+      KeyError if the request_id is not unique.
+    """
+    if request_id is None:
+      self._last_auto_id += 1
+      request_id = str(self._last_auto_id)
+    if request_id in self._ids:
+      raise KeyError("A request with this ID already exists: %s" % request_id)
+    self._ids.add(request_id)
+    self._requests.append((request_id, request))
+
+  def execute(self):
+    """Execute all the requests, at most max_workers at a time.
+
+    Returns:
+      An iterator of (request_id, response, exception) tuples in the order
+      in which the requests complete. response is the deserialized response
+      object, or None if the request failed, in which case exception is the
+      exception it raised (usually a googleapiclient.errors.HttpError).
+      Requests that haven't started yet are dropped if the iterator isn't
+      consumed to the end.
+    """
+    pending = queue.Queue()
+    for item in self._requests:
+      pending.put(item)
+    results = queue.Queue()
+    cancelled = threading.Event()
+    host_slots = {}
+    host_slots_lock = threading.Lock()
+
+    def get_host_slot(uri):
+      host = urlparse(uri).netloc
+      with host_slots_lock:
+        if host not in host_slots:
+          host_slots[host] = threading.BoundedSemaphore(self._max_per_host)
+        return host_slots[host]
+
+    def worker():
+      http = None
+      http_error = None
+      if self._http_factory is not None:
+        try:
+          http = self._http_factory()
+        except Exception as e:
+          http_error = e
+      while not cancelled.is_set():
+        try:
+          request_id, request = pending.get_nowait()
+        except queue.Empty:
+          return
+        response = None
+        exception = http_error
+        if exception is None:
+          with get_host_slot(request.uri):
+            try:
+              response = request.execute(http=http,
+                                         num_retries=self._num_retries,
+                                         scheduler=self._scheduler,
+                                         priority=self._priority)
+            except Exception as e:
+              exception = e
+        results.put((request_id, response, exception))
+
+    workers = min(self._max_workers, len(self._requests))
+    for _ in range(workers):
+      thread = threading.Thread(target=worker)
+      thread.daemon = True
+      thread.start()
+
+    return self._results(results, cancelled)
+
+  def _results(self, results, cancelled):
+    """Yields the results of execute() as they arrive."""
+    try:
+      for _ in range(len(self._requests)):
+        yield results.get()
+    finally:
+      cancelled.set()
+
+
 class HttpRequestMock(object):
   """Mock of HttpRequest.
 
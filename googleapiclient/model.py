@@ -24,6 +24,7 @@ import six
 
 __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 
+import importlib
 import json
 import logging
 
@@ -37,6 +38,39 @@ LOGGER = logging.getLogger(__name__)
 
 dump_request_response = False
 
+# JSON libraries tried, in order, for decoding responses before falling back
+# to the standard library.
+FAST_JSON_MODULES = ('orjson', 'ujson')
+
+
+def _stdlib_loads(content):
+  """Decodes a JSON document with the standard library json module."""
+  try:
+    content = content.decode('utf-8')
+  except AttributeError:
+    pass
+  return json.loads(content)
+
+
+def _find_loads():
+  """Returns the fastest available function for decoding JSON.
+
+  Returns:
+    The loads function of the first module of FAST_JSON_MODULES that is
+    installed, which takes the UTF-8 bytes of the document as they are, or
+    the standard library one.
+  """
+  for name in FAST_JSON_MODULES:
+    try:
+      module = importlib.import_module(name)
+    except ImportError:
+      continue
+    return module.loads
+  return _stdlib_loads
+
+
+json_loads = _find_loads()
+
 
 def _abstract():
   raise NotImplementedError('You need to override this function')
@@ -245,13 +279,16 @@ class JsonModel(BaseModel):
   content_type = 'application/json'
   alt_param = 'json'
 
-  def __init__(self, data_wrapper=False):
+  def __init__(self, data_wrapper=False, decoder=None):
     """Construct a JsonModel.
 
     Args:
       data_wrapper: boolean, wrap requests and responses in a data wrapper
+      decoder: callable, decodes a response body, given as bytes or text,
+        into a Python object. Defaults to json_loads.
     """
     self._data_wrapper = data_wrapper
+    self._decoder = decoder or json_loads
 
   def serialize(self, body_value):
     if (isinstance(body_value, dict) and 'data' not in body_value and
@@ -260,11 +297,7 @@ class JsonModel(BaseModel):
     return json.dumps(body_value)
 
   def deserialize(self, content):
-    try:
-        content = content.decode('utf-8')
-    except AttributeError:
-        pass
-    body = json.loads(content)
+    body = self._decoder(content)
     if self._data_wrapper and isinstance(body, dict) and 'data' in body:
       body = body['data']
     return body
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from constants import TABS
+from utils import set_thread_flags
+from utils import get_thread_label_ids
+
+from googleapiclient.errors import HttpError
+
+# Kinds of history records, each one naming a changed message
+CHANGE_KEYS = ["messagesAdded", "messagesDeleted", "labelsAdded",
+               "labelsRemoved"]
+# Only the ids of the changed threads are used, so the messages (with
+# their labels) are left out of the history.list responses
+HISTORY_FIELDS = "historyId,nextPageToken,history(%s)" % ",".join(
+    [key + "/message/threadId" for key in CHANGE_KEYS])
+
+
+class HistoryExpired(Exception):
+    """
+    Raised when the stored historyId is too old for users.history.list,
+    a full reload is needed.
+    """
+    pass
+
+
+class HistorySync(object):
+    """
+    Brings the stored thread lists up to date by asking users.history.list
+    what changed since a known historyId, and fetching again only the
+    threads that changed.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_changes(self, start_history_id):
+        """
+        Return (history_id, changed, added): the newest historyId of the
+        mailbox, the ids of the threads that changed since
+        start_history_id, and the ids of the threads that got new messages.
+        """
+        users = self.client.service.users()
+        history_id = start_history_id
+        changed = set()
+        added = set()
+        page_token = None
+
+        while True:
+            try:
+                response = users.history().list(
+                    userId="me", startHistoryId=start_history_id,
+                    pageToken=page_token, fields=HISTORY_FIELDS
+                ).execute(http=self.client.get_http(),
+                          scheduler=self.client.scheduler)
+
+            except HttpError as e:
+                if e.resp.status == 404:
+                    raise HistoryExpired(start_history_id)
+
+                raise
+
+            for record in response.get("history", []):
+                for key in CHANGE_KEYS:
+                    for change in record.get(key, []):
+                        threadid = change["message"]["threadId"]
+                        changed.add(threadid)
+
+                        if key == "messagesAdded":
+                            added.add(threadid)
+
+            history_id = response.get("historyId", history_id)
+            page_token = response.get("nextPageToken")
+            if page_token is None:
+                break
+
+        return history_id, changed, added
+
+    def sync(self, threads, start_history_id):
+        """
+        Apply every change since start_history_id to threads, a dict
+        mapping each tab to its list of threads, and return the new
+        historyId. threads is updated in place.
+
+        Raises HistoryExpired if start_history_id is too old.
+        """
+        history_id, changed, added = self.get_changes(start_history_id)
+        if not changed:
+            return history_id
+
+        users = self.client.service.users()
+        requests = []
+        for threadid in changed:
+            requests.append((threadid, users.threads().get(
+                userId="me", id=threadid, format="minimal",
+                fields="id,historyId,messages(id,labelIds,snippet)")))
+
+        # Deleted threads are left out of the responses
+        responses = self.client.execute_batch(requests, ignore_missing=True)
+
+        for threadid in changed:
+            data = responses.get(threadid)
+            thread = None
+            label_ids = set()
+
+            if data is not None and data.get("messages", []) != []:
+                label_ids = get_thread_label_ids(data)
+                thread = {
+                    "id": threadid,
+                    "historyId": data["historyId"],
+                    "snippet": data["messages"][-1].get("snippet", ""),
+                }
+                set_thread_flags(thread, label_ids)
+
+            for tab in TABS:
+                self.__apply(threads.setdefault(tab, []), threadid,
+                             thread if tab in label_ids else None,
+                             threadid in added)
+
+        return history_id
+
+    def __apply(self, tab_threads, threadid, thread, moved_to_top):
+        position = None
+        for index, old_thread in enumerate(tab_threads):
+            if old_thread["id"] == threadid:
+                position = index
+                break
+
+        if position is not None:
+            del tab_threads[position]
+
+        if thread is None:
+            return
+
+        if position is None or moved_to_top:
+            position = 0
+
+        tab_threads.insert(position, thread)
@@ -54,6 +54,8 @@ except ImportError:
 import hmac
 from gettext import gettext as _
 import socket
+import select
+import threading
 
 try:
     from httplib2 import socks
@@ -103,7 +105,7 @@ def has_timeout(timeout): # python 2.6
     return (timeout is not None)
 
 __all__ = [
-    'Http', 'Response', 'ProxyInfo', 'HttpLib2Error', 'RedirectMissingLocation',
+    'Http', 'ConnectionPool', 'Response', 'ProxyInfo', 'HttpLib2Error', 'RedirectMissingLocation',
     'RedirectLimit', 'FailedToDecompressContent',
     'UnimplementedDigestAuthOptionError',
     'UnimplementedHmacDigestAuthOptionError',
@@ -1139,6 +1141,114 @@ except (ImportError, AttributeError):
     pass
 
 
+class ConnectionPool(object):
+    """A thread-safe pool of keep-alive connections.
+
+    Several Http objects, typically one per thread, can share a pool so
+    that a connection opened by one of them is reused by the others
+    instead of paying for a new TCP and TLS handshake. A connection is
+    only ever used by one request at a time: it is taken out of the pool
+    for the duration of the request and put back once the response has
+    been read.
+
+    At most 'max_per_host' idle connections are kept for each
+    scheme/authority pair. Idle connections older than 'idle_timeout'
+    seconds, or whose socket has become readable (which means the server
+    closed it), are discarded instead of being handed out.
+
+    Http objects sharing a pool should use the same timeout, proxy and
+    certificate settings, since connections are only keyed by
+    scheme and authority.
+    """
+    def __init__(self, max_per_host=4, idle_timeout=60):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        # Map "scheme:authority" to a list of (connection, released at)
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'expired': 0,
+            'stale': 0,
+            'discarded': 0,
+        }
+
+    def _is_healthy(self, conn):
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (select.error, socket.error, ValueError, TypeError):
+            return False
+        # An idle keep-alive socket has nothing to read; if it is readable
+        # the server has closed it or sent something we did not ask for.
+        return not readable
+
+    def acquire(self, key, factory):
+        """Return an idle connection for 'key', or a new one made by
+        calling 'factory'."""
+        now = time.time()
+        discard = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate, released = idle.pop()
+                if now - released > self.idle_timeout:
+                    self._stats['expired'] += 1
+                    discard.append(candidate)
+                elif not self._is_healthy(candidate):
+                    self._stats['stale'] += 1
+                    discard.append(candidate)
+                else:
+                    self._stats['reused'] += 1
+                    conn = candidate
+                    break
+            if conn is None:
+                self._stats['created'] += 1
+        for candidate in discard:
+            candidate.close()
+        if conn is None:
+            conn = factory()
+        return conn
+
+    def release(self, key, conn):
+        """Return 'conn' to the pool once its response has been read."""
+        if getattr(conn, 'sock', None) is None:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_per_host:
+                idle.append((conn, time.time()))
+                return
+            self._stats['discarded'] += 1
+        conn.close()
+
+    def discard(self, conn):
+        """Close 'conn' instead of returning it, e.g. after an error left
+        it in an unknown state."""
+        with self._lock:
+            self._stats['discarded'] += 1
+        conn.close()
+
+    def stats(self):
+        """Return a dict of counters, plus the number of idle connections."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(idle) for idle in self._idle.values())
+        return stats
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, released in conns:
+                conn.close()
+
+
 class Http(object):
     """An HTTP client that handles:
 
@@ -1155,7 +1265,8 @@ class Http(object):
     """
     def __init__(self, cache=None, timeout=None,
                  proxy_info=proxy_info_from_environment,
-                 ca_certs=None, disable_ssl_certificate_validation=False):
+                 ca_certs=None, disable_ssl_certificate_validation=False,
+                 connection_pool=None):
         """If 'cache' is a string then it is used as a directory name for
         a disk cache. Otherwise it must be an object that supports the
         same interface as FileCache.
@@ -1178,6 +1289,11 @@ class Http(object):
 
         If disable_ssl_certificate_validation is true, SSL cert validation will
         not be performed.
+
+        connection_pool is an optional ConnectionPool. When given, connections
+        are borrowed from it for each request instead of being kept in this
+        object, so it can be shared by Http objects used from different
+        threads.
         """
         self.proxy_info = proxy_info
         self.ca_certs = ca_certs
@@ -1186,6 +1302,7 @@ class Http(object):
 
         # Map domain name to an httplib connection
         self.connections = {}
+        self.connection_pool = connection_pool
         # The location of the cache, for now a directory
         # where cached responses are held.
         if cache and isinstance(cache, basestring):
@@ -1230,11 +1347,14 @@ class Http(object):
             del state_dict['request']
         if 'connections' in state_dict:
             del state_dict['connections']
+        if 'connection_pool' in state_dict:
+            del state_dict['connection_pool']
         return state_dict
 
     def __setstate__(self, state):
         self.__dict__.update(state)
         self.connections = {}
+        self.connection_pool = None
 
     def _auth_from_challenge(self, host, request_uri, headers, response, content):
         """A generator that creates Authorization objects
@@ -1443,6 +1563,7 @@ class Http(object):
         being and instance of the 'Response' class, the second being
         a string that contains the response entity body.
         """
+        pooled_conn = None
         try:
             if headers is None:
                 headers = {}
@@ -1463,33 +1584,16 @@ class Http(object):
             proxy_info = self._get_proxy_info(scheme, authority)
 
             conn_key = scheme+":"+authority
-            if conn_key in self.connections:
+            if self.connection_pool is not None:
+                conn = pooled_conn = self.connection_pool.acquire(conn_key,
+                        lambda: self._new_connection(scheme, authority,
+                                                     proxy_info,
+                                                     connection_type))
+            elif conn_key in self.connections:
                 conn = self.connections[conn_key]
             else:
-                if not connection_type:
-                    connection_type = SCHEME_TO_CONNECTION[scheme]
-                certs = list(self.certificates.iter(authority))
-                if scheme == 'https':
-                    if certs:
-                        conn = self.connections[conn_key] = connection_type(
-                                authority, key_file=certs[0][0],
-                                cert_file=certs[0][1], timeout=self.timeout,
-                                proxy_info=proxy_info,
-                                ca_certs=self.ca_certs,
-                                disable_ssl_certificate_validation=
-                                        self.disable_ssl_certificate_validation)
-                    else:
-                        conn = self.connections[conn_key] = connection_type(
-                                authority, timeout=self.timeout,
-                                proxy_info=proxy_info,
-                                ca_certs=self.ca_certs,
-                                disable_ssl_certificate_validation=
-                                        self.disable_ssl_certificate_validation)
-                else:
-                    conn = self.connections[conn_key] = connection_type(
-                            authority, timeout=self.timeout,
-                            proxy_info=proxy_info)
-                conn.set_debuglevel(debuglevel)
+                conn = self.connections[conn_key] = self._new_connection(
+                        scheme, authority, proxy_info, connection_type)
 
             if 'range' not in headers and 'accept-encoding' not in headers:
                 headers['accept-encoding'] = 'gzip, deflate'
@@ -1608,6 +1712,10 @@ class Http(object):
                 else:
                     (response, content) = self._request(conn, authority, uri, request_uri, method, body, headers, redirections, cachekey)
         except Exception, e:
+            if pooled_conn is not None:
+                # The connection may be half way through a request.
+                self.connection_pool.discard(pooled_conn)
+                pooled_conn = None
             if self.force_exception_to_status_code:
                 if isinstance(e, HttpLib2ErrorWithResponse):
                     response = e.response
@@ -1632,10 +1740,40 @@ class Http(object):
                     response.reason = "Bad Request"
             else:
                 raise
-
+        finally:
+            if pooled_conn is not None:
+                self.connection_pool.release(conn_key, pooled_conn)
 
         return (response, content)
 
+    def _new_connection(self, scheme, authority, proxy_info, connection_type):
+        """Create a connection to 'authority' for the given scheme."""
+        if not connection_type:
+            connection_type = SCHEME_TO_CONNECTION[scheme]
+        certs = list(self.certificates.iter(authority))
+        if scheme == 'https':
+            if certs:
+                conn = connection_type(
+                        authority, key_file=certs[0][0],
+                        cert_file=certs[0][1], timeout=self.timeout,
+                        proxy_info=proxy_info,
+                        ca_certs=self.ca_certs,
+                        disable_ssl_certificate_validation=
+                                self.disable_ssl_certificate_validation)
+            else:
+                conn = connection_type(
+                        authority, timeout=self.timeout,
+                        proxy_info=proxy_info,
+                        ca_certs=self.ca_certs,
+                        disable_ssl_certificate_validation=
+                                self.disable_ssl_certificate_validation)
+        else:
+            conn = connection_type(
+                    authority, timeout=self.timeout,
+                    proxy_info=proxy_info)
+        conn.set_debuglevel(debuglevel)
+        return conn
+
     def _get_proxy_info(self, scheme, authority):
         """Return a ProxyInfo instance (or None) based on the scheme
         and authority.
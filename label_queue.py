@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import threading
+
+from workers import idle_call
+
+from gi.repository import GLib
+
+# Milliseconds to wait for more changes before sending them
+FLUSH_DELAY = 1000
+
+
+class LabelQueue(object):
+    """
+    Applies label changes (star, read, important) to the local copy right
+    away and sends them to Gmail later, in one batch.
+
+    Changes to the same thread are merged, so starring and unstarring a
+    thread before the queue is flushed sends nothing. If Gmail rejects a
+    change, it's rolled back locally.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+        # thread id -> {label: bool}
+        self.__original = {}
+        self.__wanted = {}
+        self.__flushing = {}
+        self.__lock = threading.Lock()
+        self.__tid = None
+
+    def change(self, threadid, label, value, current=None):
+        """
+        Add (value=True) or remove (value=False) a label from a thread. Can
+        be called from any thread. current is whether the thread has the
+        label before the change; when not given it's read from the store,
+        which can wait for a worker, so the main loop should pass it.
+        """
+        if current is None:
+            summary = self.client.store.get_summary(threadid)
+            current = summary is not None and label in summary["labelIds"]
+
+        with self.__lock:
+            original = self.__original.setdefault(threadid, {})
+            if label not in original:
+                original[label] = current
+
+            self.__wanted.setdefault(threadid, {})[label] = value
+
+        if value:
+            self.client.apply_labels(threadid, add=[label])
+        else:
+            self.client.apply_labels(threadid, remove=[label])
+
+        idle_call(self.__schedule)
+
+    def __schedule(self):
+        if self.__tid is None:
+            self.__tid = GLib.timeout_add(FLUSH_DELAY, self.__flush)
+
+    def __take_changes(self):
+        """
+        Return {thread id: (labels to add, labels to remove)} leaving out
+        the labels that ended up as they were, and empty the queue.
+        """
+        changes = {}
+        with self.__lock:
+            for threadid in self.__wanted.keys():
+                add = []
+                remove = []
+                for label, value in self.__wanted[threadid].items():
+                    if value == self.__original[threadid][label]:
+                        continue
+
+                    if value:
+                        add.append(label)
+                    else:
+                        remove.append(label)
+
+                if add != [] or remove != []:
+                    changes[threadid] = (add, remove)
+
+            self.__original = {}
+            self.__wanted = {}
+
+        return changes
+
+    def __flush(self):
+        self.__tid = None
+        if self.__flushing != {}:
+            # Wait for the changes being sent
+            self.__schedule()
+            return False
+
+        self.__flushing = self.__take_changes()
+        if self.__flushing != {}:
+            self.client.modify_labels(
+                self.__flushing, self.__flushed_cb, self.__flush_error_cb)
+
+        return False
+
+    def __rollback(self, threadids):
+        for threadid in threadids:
+            add, remove = self.__flushing[threadid]
+            self.client.apply_labels(threadid, add=remove, remove=add)
+
+    def __flushed_cb(self, failed):
+        self.__rollback(failed)
+        self.__flushing = {}
+
+    def __flush_error_cb(self, error):
+        self.__rollback(self.__flushing.keys())
+        self.__flushing = {}
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread safe dict holding at most max_size items, the least
+    recently used item is dropped first.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.__lock:
+            if key not in self.__items:
+                return default
+
+            value = self.__items.pop(key)
+            self.__items[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__items.pop(key, None)
+            self.__items[key] = value
+
+            while len(self.__items) > self.max_size:
+                self.__items.popitem(last=False)
+
+    def remove(self, key):
+        with self.__lock:
+            self.__items.pop(key, None)
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__items
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__items)
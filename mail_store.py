@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import json
+import sqlite3
+import threading
+
+from utils import set_thread_flags
+from utils import get_thread_label_ids
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS threads (
+    id TEXT PRIMARY KEY,
+    history_id TEXT,
+    snippet TEXT,
+    label_ids TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS tab_threads (
+    tab TEXT,
+    position INTEGER,
+    thread_id TEXT,
+    PRIMARY KEY (tab, position)
+);
+-- Left by older versions, which also kept decoded message bodies
+DROP TABLE IF EXISTS messages;
+"""
+
+
+class MailStore(object):
+    """
+    On-disk copy of the mailbox: profile, labels, the thread list of each
+    tab, and the full payload of every opened thread.
+
+    A thread's full payload is dropped as soon as a newer historyId is
+    saved for it, so get_thread() never returns stale data.
+    """
+
+    def __init__(self, path):
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.executescript(SCHEMA)
+        self.__connection.commit()
+
+    def __execute(self, query, args=()):
+        with self.__lock:
+            cursor = self.__connection.execute(query, args)
+            rows = cursor.fetchall()
+            self.__connection.commit()
+
+        return rows
+
+    def get_value(self, key, default=None):
+        rows = self.__execute("SELECT value FROM state WHERE key = ?", (key,))
+        if rows == []:
+            return default
+
+        return json.loads(rows[0][0])
+
+    def set_value(self, key, value):
+        self.__execute("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                       (key, json.dumps(value)))
+
+    def __save_summary(self, cursor, thread):
+        row = cursor.execute(
+            "SELECT history_id, data FROM threads WHERE id = ?",
+            (thread["id"],)).fetchone()
+
+        data = None
+        if row is not None and row[0] == thread["historyId"]:
+            data = row[1]
+
+        cursor.execute(
+            "INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?, ?)",
+            (thread["id"], thread["historyId"], thread.get("snippet", ""),
+             json.dumps(thread.get("labelIds", [])), data))
+
+    def save_thread_lists(self, threads):
+        """
+        Replace the stored thread list of every tab in threads, a dict
+        mapping each tab to a list of thread summaries.
+        """
+        with self.__lock:
+            cursor = self.__connection.cursor()
+            for tab in threads.keys():
+                cursor.execute("DELETE FROM tab_threads WHERE tab = ?", (tab,))
+                for position, thread in enumerate(threads[tab]):
+                    self.__save_summary(cursor, thread)
+                    cursor.execute(
+                        "INSERT INTO tab_threads VALUES (?, ?, ?)",
+                        (tab, position, thread["id"]))
+
+            self.__connection.commit()
+
+    def get_thread_lists(self):
+        """
+        Return a dict mapping each tab to its stored list of threads, with
+        the same flags Client.load sets.
+        """
+        rows = self.__execute(
+            "SELECT tab_threads.tab, threads.id, threads.history_id, "
+            "threads.snippet, threads.label_ids FROM tab_threads "
+            "JOIN threads ON threads.id = tab_threads.thread_id "
+            "ORDER BY tab_threads.tab, tab_threads.position")
+
+        threads = {}
+        for tab, id, history_id, snippet, label_ids in rows:
+            thread = {
+                "id": id,
+                "historyId": history_id,
+                "snippet": snippet,
+            }
+            set_thread_flags(thread, json.loads(label_ids))
+            threads.setdefault(tab, []).append(thread)
+
+        return threads
+
+    def get_summary(self, threadid):
+        rows = self.__execute(
+            "SELECT history_id, label_ids FROM threads WHERE id = ?",
+            (threadid,))
+        if rows == []:
+            return None
+
+        return {
+            "id": threadid,
+            "historyId": rows[0][0],
+            "labelIds": json.loads(rows[0][1]),
+        }
+
+    def has_thread(self, threadid):
+        """
+        Return whether get_thread() would return the full payload of a
+        thread, without loading it.
+        """
+        rows = self.__execute(
+            "SELECT data IS NOT NULL FROM threads WHERE id = ?", (threadid,))
+        return rows != [] and bool(rows[0][0])
+
+    def get_thread(self, threadid):
+        """
+        Return the stored full payload of a thread, or None if it was never
+        saved or it changed since then.
+        """
+        rows = self.__execute("SELECT data FROM threads WHERE id = ?",
+                              (threadid,))
+        if rows == [] or rows[0][0] is None:
+            return None
+
+        return json.loads(rows[0][0])
+
+    def save_thread(self, thread):
+        """
+        Save the full payload of a thread (as returned by threads().get).
+        """
+        label_ids = list(get_thread_label_ids(thread))
+
+        with self.__lock:
+            cursor = self.__connection.cursor()
+            row = cursor.execute("SELECT snippet FROM threads WHERE id = ?",
+                                 (thread["id"],)).fetchone()
+            snippet = row[0] if row is not None else ""
+
+            cursor.execute(
+                "INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?, ?)",
+                (thread["id"], thread["historyId"], snippet,
+                 json.dumps(label_ids), json.dumps(thread)))
+            self.__connection.commit()
+
+    def drop_thread(self, threadid):
+        """
+        Forget the full payload of a thread, e.g. after a reply is sent.
+        """
+        self.__execute("UPDATE threads SET data = NULL WHERE id = ?",
+                       (threadid,))
+
+    def set_thread_labels(self, threadid, add=[], remove=[]):
+        """
+        Apply a label change to the stored copy of a thread without
+        touching its historyId.
+        """
+        summary = self.get_summary(threadid)
+        if summary is None:
+            return
+
+        label_ids = set(summary["labelIds"])
+        label_ids.update(add)
+        label_ids.difference_update(remove)
+
+        thread = self.get_thread(threadid)
+        if thread is not None:
+            for message in thread.get("messages", []):
+                message_ids = set(message.get("labelIds", []))
+                message_ids.update(add)
+                message_ids.difference_update(remove)
+                message["labelIds"] = list(message_ids)
+
+            thread = json.dumps(thread)
+
+        self.__execute(
+            "UPDATE threads SET label_ids = ?, data = ? WHERE id = ?",
+            (json.dumps(list(label_ids)), thread, threadid))
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
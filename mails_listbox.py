@@ -28,12 +28,18 @@ gi.require_version("Gtk", "3.0")
 
 from gi.repository import Gtk
 from gi.repository import Gdk
+from gi.repository import GLib
 from gi.repository import Pango
 from gi.repository import GObject
 
 from sugar3.graphics.icon import CellRendererIcon
 from sugar3 import profile
 
+# Rows below the visible ones whose threads are prefetched, and how long
+# scrolling has to stop before prefetching (in milliseconds)
+PREFETCH_AHEAD = 10
+PREFETCH_DELAY = 300
+
 
 class TreeView(Gtk.ScrolledWindow):
 
@@ -101,13 +107,21 @@ class ThreadsListBox(TreeView):
 
     __gsignals__ = {
         "favorited": (GObject.SIGNAL_RUN_LAST, None, [str, bool]),
+        "load-more": (GObject.SIGNAL_RUN_LAST, None, []),
+        "prefetch": (GObject.SIGNAL_RUN_LAST, None, [GObject.TYPE_PYOBJECT]),
     }
 
     def __init__(self, category):
         # important, starred, text, id, history id, background color
         TreeView.__init__(self, Gtk.ListStore(bool, bool, str, str, str, str), 3)
         self.category = category
+        self.loading_more = False
+        self.__prefetch_tid = None
         self.set_size_request(300, 1)
+
+        adjustment = self.get_vadjustment()
+        adjustment.connect("value-changed", self.__scrolled_cb)
+        adjustment.connect("changed", self.__scrolled_cb)
         renderer_toggle = Gtk.CellRendererToggle()
         renderer_toggle.connect("toggled", self.__important_setted)
         column_toggle = Gtk.TreeViewColumn("Important", renderer_toggle, active=0)
@@ -125,6 +139,44 @@ class ThreadsListBox(TreeView):
         column_text = Gtk.TreeViewColumn("Mail", renderer_text, text=2, background=5)
         self.view.append_column(column_text)
 
+    def __scrolled_cb(self, adjustment):
+        self.request_prefetch()
+
+        # Ask for the next page when less than a screen is left below,
+        # this includes lists that don't fill the screen yet
+        remaining = adjustment.get_upper() - adjustment.get_value() - \
+            adjustment.get_page_size()
+        if remaining < adjustment.get_page_size() and not self.loading_more:
+            self.loading_more = True
+            self.emit("load-more")
+
+    def __prefetch(self):
+        self.__prefetch_tid = None
+
+        visible = self.view.get_visible_range()
+        if visible is None:
+            return False
+
+        start = visible[0].get_indices()[0]
+        end = min(visible[1].get_indices()[0] + PREFETCH_AHEAD,
+                  len(self.model) - 1)
+
+        threadids = [self.model[x][3] for x in range(start, end + 1)]
+        if threadids != []:
+            self.emit("prefetch", threadids)
+
+        return False
+
+    def request_prefetch(self):
+        """
+        Ask for the visible threads and the next PREFETCH_AHEAD ones once
+        the list stops changing.
+        """
+        if self.__prefetch_tid is not None:
+            GLib.source_remove(self.__prefetch_tid)
+
+        self.__prefetch_tid = GLib.timeout_add(PREFETCH_DELAY, self.__prefetch)
+
     def __important_setted(self, widget, path):
         self.model[path][0] = not self.model[path][0]
 
@@ -140,30 +192,72 @@ class ThreadsListBox(TreeView):
         else:
             cell.props.xo_color = None
 
-    def set_threads(self, threads):
-        for thread in threads:
-            snippet = unicode_to_string(thread["snippet"])
-            id = unicode_to_string(thread["id"])
-            historyid = unicode_to_string(thread["historyId"])
+    def __get_row(self, thread):
+        snippet = unicode_to_string(thread["snippet"])
+        id = unicode_to_string(thread["id"])
+        historyid = unicode_to_string(thread["historyId"])
+
+        background_color = '#EEEEEE'
+        if thread["UNREAD"]:
+            background_color = 'white'
 
-            background_color = '#EEEEEE'
-            if thread["UNREAD"]:
-                background_color = 'white'
+        starred = False
+        if thread["STARRED"]:
+            starred = True
 
-            starred = False
-            if thread["STARRED"]:
-                starred = True
-            self.model.append([False, starred, snippet, id,
-                               historyid, background_color])
+        return [False, starred, snippet, id, historyid, background_color]
 
+    def set_threads(self, threads):
+        self.loading_more = False
+        for thread in threads:
+            self.model.append(self.__get_row(thread))
+
+        self.request_prefetch()
         self.show_all()
 
+    def update_threads(self, threads):
+        """
+        Make the model show threads, touching only the rows that changed.
+        """
+        self.loading_more = False
+        ids = [thread["id"] for thread in threads]
+        for row in list(self.model):
+            if row[3] not in ids:
+                self.model.remove(row.iter)
+
+        for position, thread in enumerate(threads):
+            row = self.__get_row(thread)
+            iter = self.model.iter_nth_child(None, position)
+
+            if iter is not None and self.model[iter][3] == row[3]:
+                if self.model[iter][4] != row[4] or \
+                   self.model[iter][1] != row[1] or \
+                   self.model[iter][5] != row[5]:
+                    self.model[iter] = row
+                continue
+
+            old_iter = None
+            for old_row in self.model:
+                if old_row[3] == row[3]:
+                    old_iter = old_row.iter
+                    break
+
+            if old_iter is None:
+                self.model.insert(position, row)
+            else:
+                self.model[old_iter] = row
+                self.model.move_before(old_iter, iter)
+
+        self.request_prefetch()
+
 
 class ThreadsNotebook(Gtk.Notebook):
 
     __gsignals__ = {
         "thread-selected": (GObject.SIGNAL_RUN_LAST, None, [str]),
         "favorite-clicked": (GObject.SIGNAL_RUN_LAST, None, [str, bool]),
+        "load-more": (GObject.SIGNAL_RUN_LAST, None, [str]),
+        "prefetch": (GObject.SIGNAL_RUN_LAST, None, [GObject.TYPE_PYOBJECT]),
     }
 
     def __init__(self):
@@ -176,19 +270,33 @@ class ThreadsNotebook(Gtk.Notebook):
             listbox = ThreadsListBox(tab)
             listbox.connect("selected", self.__thread_selected_cb)
             listbox.connect("favorited", self.__favorite_clicked_cb)
+            listbox.connect("load-more", self.__load_more_cb)
+            listbox.connect("prefetch", self.__prefetch_cb)
             self.append_page(listbox, label)
             self.child_set_property(listbox, "tab-expand", True)
 
             self.listboxes[tab] = listbox
 
+        self.connect("switch-page", self.__switch_page_cb)
         self.show_all()
 
+    def __switch_page_cb(self, notebook, listbox, page_num):
+        listbox.request_prefetch()
+
+    def __prefetch_cb(self, listbox, threadids):
+        # Only the threads of the visible tab are worth downloading
+        if self.get_nth_page(self.get_current_page()) == listbox:
+            self.emit("prefetch", threadids)
+
     def __thread_selected_cb(self, listbox, threadid):
         self.emit("thread-selected", threadid)
 
     def __favorite_clicked_cb(self, listbox, threadid, starred):
         self.emit("favorite-clicked", threadid, starred)
 
+    def __load_more_cb(self, listbox):
+        self.emit("load-more", listbox.category)
+
 
 class MailsListBox(Gtk.HBox):
 
@@ -196,12 +304,15 @@ class MailsListBox(Gtk.HBox):
         "label-selected": (GObject.SIGNAL_RUN_LAST, None, [str]),
         "thread-selected": (GObject.SIGNAL_RUN_LAST, None, [str]),
         "favorite-clicked": (GObject.SIGNAL_RUN_LAST, None, [str, bool]),
+        "load-more": (GObject.SIGNAL_RUN_LAST, None, [str]),
+        "prefetch": (GObject.SIGNAL_RUN_LAST, None, [GObject.TYPE_PYOBJECT]),
     }
 
     def __init__(self):
         Gtk.HBox.__init__(self)
 
         self.threads = {}
+        self.query = "INBOX"
 
         self.labels_view = LabelsListBox()
         self.labels_view.connect("selected", self.__label_selected_cb)
@@ -212,6 +323,8 @@ class MailsListBox(Gtk.HBox):
             "thread-selected", self.__thread_selected_cb)
         self.threads_notebook.connect(
             "favorite-clicked", self.__favorite_clicked_cb)
+        self.threads_notebook.connect("load-more", self.__load_more_cb)
+        self.threads_notebook.connect("prefetch", self.__prefetch_cb)
         self.pack_start(self.threads_notebook, True, True, 0)
 
         self.show_all()
@@ -219,16 +332,30 @@ class MailsListBox(Gtk.HBox):
     def set_threads(self, threads):
         self.threads = threads
         for tab in threads.keys():
-            self.threads_notebook.listboxes[tab].set_threads(threads[tab])
+            self.threads_notebook.listboxes[tab].model.clear()
+            self.threads_notebook.listboxes[tab].set_threads(
+                self.__filter_threads(threads[tab]))
+
+    def update_threads(self, threads):
+        self.threads.update(threads)
+        for tab in threads.keys():
+            self.threads_notebook.listboxes[tab].update_threads(
+                self.__filter_threads(threads[tab]))
+
+    def __filter_threads(self, threads):
+        valid_threads = []
+        for thread in threads:
+            if thread[self.query] or self.query == "INBOX":
+                valid_threads.append(thread)
+
+        return valid_threads
 
     def filter(self, query):
+        self.query = query
         for tab in self.threads.keys():
             self.threads_notebook.listboxes[tab].model.clear()
-            valid_threads = []
-            for thread in self.threads[tab]:
-                if thread[query] or query == "INBOX":
-                    valid_threads.append(thread)
-            self.threads_notebook.listboxes[tab].set_threads(valid_threads)
+            self.threads_notebook.listboxes[tab].set_threads(
+                self.__filter_threads(self.threads[tab]))
 
     def set_labels(self, labels):
         self.labels_view.set_labels(labels)
@@ -242,6 +369,12 @@ class MailsListBox(Gtk.HBox):
     def __favorite_clicked_cb(self, notebook, threadid, starred):
         self.emit("favorite-clicked", threadid, starred)
 
+    def __load_more_cb(self, notebook, tab):
+        self.emit("load-more", tab)
+
+    def __prefetch_cb(self, notebook, threadids):
+        self.emit("prefetch", threadids)
+
 
 class CellRendererFavourite(CellRendererIcon):
     __gtype_name__ = "CellRendererFavourite"
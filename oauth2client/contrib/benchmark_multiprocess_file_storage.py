@@ -0,0 +1,123 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Multi-process contention benchmark for MultiprocessFileStorage.
+
+Several processes read the same credentials file while another one keeps
+storing refreshed credentials in it, like several activity instances
+sharing one login. Reads are timed through the locked path every read used
+to take, and through :meth:`MultiprocessFileStorage.get`, which skips the
+locks while the file is unchanged::
+
+    python -m oauth2client.contrib.benchmark_multiprocess_file_storage \\
+        [readers] [reads]
+"""
+
+from __future__ import print_function
+
+import datetime
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from oauth2client import client
+from oauth2client.contrib import multiprocess_file_storage
+
+
+READERS = 4
+READS = 2000
+# Seconds between the writes of the writer process.
+WRITE_INTERVAL = 0.05
+KEY = 'benchmark'
+
+
+def _credentials(token):
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    return client.OAuth2Credentials(
+        token, 'client-id', 'client-secret', 'refresh-token', expiry,
+        'https://oauth2.googleapis.com/token', 'benchmark')
+
+
+def _store(filename, credentials):
+    storage = multiprocess_file_storage.MultiprocessFileStorage(filename, KEY)
+    storage.put(credentials)
+
+
+def _read(filename, locked, reads, results):
+    storage = multiprocess_file_storage.MultiprocessFileStorage(filename, KEY)
+    start = time.time()
+    for _ in range(reads):
+        if locked:
+            client.Storage.get(storage)
+        else:
+            storage.get()
+    results.put((time.time() - start) / reads)
+
+
+def _write(filename, stop):
+    storage = multiprocess_file_storage.MultiprocessFileStorage(filename, KEY)
+    writes = 0
+    while not stop.is_set():
+        writes += 1
+        storage.put(_credentials('token-%d' % writes))
+        stop.wait(WRITE_INTERVAL)
+
+
+def _run(filename, locked, readers, reads):
+    """Returns the mean time in seconds of a read in each reader."""
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    writer = multiprocessing.Process(target=_write, args=(filename, stop))
+    processes = [
+        multiprocessing.Process(target=_read,
+                                args=(filename, locked, reads, results))
+        for _ in range(readers)]
+
+    writer.start()
+    for process in processes:
+        process.start()
+    times = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    stop.set()
+    writer.join()
+    return times
+
+
+def main(readers=READERS, reads=READS):
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'credentials.json')
+        # Written from another process, so that this one has no backend
+        # to pass on to the readers.
+        setup = multiprocessing.Process(
+            target=_store, args=(filename, _credentials('token-0')))
+        setup.start()
+        setup.join()
+
+        print('%d readers, %d reads each, a write every %d ms' % (
+            readers, reads, WRITE_INTERVAL * 1000))
+        for name, locked in [('locked', True), ('lock-free', False)]:
+            times = _run(filename, locked, readers, reads)
+            print('%-10s %.1f us per read (slowest reader %.1f us)' % (
+                name, sum(times) / len(times) * 1e6, max(times) * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,168 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""File storage for a single credential, cached in memory.
+
+:class:`oauth2client.file.Storage` reads and parses the file every time the
+credentials are refreshed, and writes it back before the refresh returns.
+:class:`CachedFileStorage` reads the file once and keeps the credentials in
+memory. Writes only happen when the stored credentials actually change, and
+are done from a background thread, atomically by writing a temporary file
+and renaming it over the old one.
+
+Only use it when this process is the only one refreshing the credentials,
+since changes made to the file by other processes are not seen.
+"""
+
+import copy
+import logging
+import os
+import tempfile
+import threading
+
+from oauth2client import _helpers
+from oauth2client import client
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachedFileStorage(client.Storage):
+    """Store and retrieve a single credential to and from a file, through
+    an in-memory cache.
+
+    Args:
+        filename: string, the file the credentials are kept in.
+    """
+
+    def __init__(self, filename):
+        """Construct a CachedFileStorage instance."""
+        super(CachedFileStorage, self).__init__(lock=threading.Lock())
+        self._filename = filename
+        self._loaded = False
+        self._credentials = None
+        self._serialized = None
+        # The JSON waiting to be written by the writer thread, if any.
+        self._pending = None
+        self._pending_lock = threading.Lock()
+        self._writing = False
+        self._writer = None
+
+    def locked_get(self):
+        """Retrieve the credentials, reading the file the first time.
+
+        Returns:
+            oauth2client.client.Credentials, a copy of the cached credentials
+            or None.
+
+        Raises:
+            IOError if the file is a symbolic link.
+        """
+        if not self._loaded:
+            self._load()
+        if self._credentials is None:
+            return None
+
+        credentials = copy.copy(self._credentials)
+        credentials.set_store(self)
+        return credentials
+
+    def _load(self):
+        _helpers.validate_file(self._filename)
+        try:
+            with open(self._filename, 'rb') as f:
+                content = f.read()
+        except IOError:
+            content = None
+
+        if content:
+            try:
+                self._credentials = client.Credentials.new_from_json(content)
+                self._serialized = _helpers._from_bytes(content)
+            except ValueError:
+                pass
+        self._loaded = True
+
+    def locked_put(self, credentials):
+        """Cache the credentials, and write them out if they changed.
+
+        Args:
+            credentials: Credentials, the credentials to store.
+        """
+        serialized = credentials.to_json()
+        self._loaded = True
+        if serialized == self._serialized:
+            return
+
+        self._credentials = copy.copy(credentials)
+        self._serialized = serialized
+        self._write_later(serialized)
+
+    def locked_delete(self):
+        """Forget the credentials and delete the file."""
+        self._loaded = True
+        self._credentials = None
+        self._serialized = None
+        with self._pending_lock:
+            self._pending = None
+        self.flush()
+        try:
+            os.unlink(self._filename)
+        except OSError:
+            pass
+
+    def flush(self):
+        """Wait until the pending write, if any, is done."""
+        writer = self._writer
+        if writer is not None:
+            writer.join()
+
+    def _write_later(self, serialized):
+        with self._pending_lock:
+            self._pending = serialized
+            if self._writing:
+                # The running writer picks up the new content.
+                return
+            self._writing = True
+            self._writer = threading.Thread(target=self._write_pending)
+            self._writer.start()
+
+    def _write_pending(self):
+        while True:
+            with self._pending_lock:
+                serialized, self._pending = self._pending, None
+                if serialized is None:
+                    self._writing = False
+                    return
+            try:
+                self._write(serialized)
+            except (IOError, OSError) as error:
+                logger.warning('Failed to write %s: %s', self._filename,
+                               error)
+
+    def _write(self, serialized):
+        """Replace the file with serialized, atomically."""
+        _helpers.validate_file(self._filename)
+        directory, name = os.path.split(os.path.abspath(self._filename))
+        fd, temp = tempfile.mkstemp(prefix='.' + name, dir=directory)
+        try:
+            # mkstemp creates the file readable by the owner only.
+            with os.fdopen(fd, 'w') as f:
+                f.write(serialized)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temp, self._filename)
+        except Exception:
+            os.unlink(temp)
+            raise
@@ -37,6 +37,10 @@ Process & thread safety guarantees the following behavior:
       credential to disk, This logic happens during every lock cycle - if the
       credentials are refreshed again it will retry locking and writing as
       normal.
+    * Reading credentials that are still valid doesn't take either lock, as
+      long as the file hasn't changed since it was last read by this
+      process. Writes replace the file atomically, so unlocked readers never
+      see a partial file.
 
 Usage
 =====
@@ -79,6 +83,7 @@ import base64
 import json
 import logging
 import os
+import tempfile
 import threading
 
 import fasteners
@@ -112,6 +117,15 @@ def _create_file_if_needed(filename):
         return True
 
 
+def _file_stamp(stat):
+    """Returns what identifies a version of a file, from its stat result.
+
+    Writes replace the file, so a new version has a new inode, and usually
+    a new modification time and size as well.
+    """
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+
 def _load_credentials_file(credentials_file):
     """Load credentials from the given file handle.
 
@@ -186,6 +200,30 @@ def _write_credentials_file(credentials_file, credentials):
     credentials_file.truncate()
 
 
+def _replace_credentials_file(filename, credentials):
+    """Atomically replaces a credentials file.
+
+    The credentials are written to a temporary file in the same directory,
+    which is then renamed over filename.
+
+    Args:
+        filename: The path of the credentials file.
+        credentials: A dictionary mapping user-defined keys to an instance of
+            :class:`oauth2client.client.Credentials`.
+    """
+    directory, name = os.path.split(filename)
+    fd, temp = tempfile.mkstemp(prefix='.' + name, dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as credentials_file:
+            _write_credentials_file(credentials_file, credentials)
+            credentials_file.flush()
+            os.fsync(credentials_file.fileno())
+        os.rename(temp, filename)
+    except Exception:
+        os.unlink(temp)
+        raise
+
+
 class _MultiprocessStorageBackend(object):
     """Thread-local backend for multiprocess storage.
 
@@ -202,14 +240,22 @@ class _MultiprocessStorageBackend(object):
         self._thread_lock = threading.Lock()
         self._read_only = False
         self._credentials = {}
+        # The stamp of the version of the file self._credentials was read
+        # from or written to.
+        self._stamp = None
 
     def _load_credentials(self):
-        """(Re-)loads the credentials from the file."""
+        """(Re-)loads the credentials from the file, if it changed."""
         if not self._file:
             return
 
+        stamp = _file_stamp(os.fstat(self._file.fileno()))
+        if stamp == self._stamp:
+            return
+
         loaded_credentials = _load_credentials_file(self._file)
         self._credentials.update(loaded_credentials)
+        self._stamp = stamp
 
         logger.debug('Read credential file')
 
@@ -218,7 +264,11 @@ class _MultiprocessStorageBackend(object):
             logger.debug('In read-only mode, not writing credentials.')
             return
 
-        _write_credentials_file(self._file, self._credentials)
+        _replace_credentials_file(self._filename, self._credentials)
+        # Keep reading the new version for the rest of the lock cycle.
+        self._file.close()
+        self._file = open(self._filename, 'r+')
+        self._stamp = _file_stamp(os.fstat(self._file.fileno()))
         logger.debug('Wrote credential file {0}.'.format(self._filename))
 
     def acquire_lock(self):
@@ -263,6 +313,26 @@ class _MultiprocessStorageBackend(object):
         else:
             return False
 
+    def get_unlocked(self, key):
+        """Returns the cached credentials for key, without locking.
+
+        Returns:
+            The credentials, or None if they must be read under the locks:
+            they are missing or need a refresh, or the file changed since it
+            was read.
+        """
+        try:
+            stamp = _file_stamp(os.stat(self._filename))
+        except OSError:
+            return None
+        if stamp != self._stamp:
+            return None
+
+        credentials = self._credentials.get(key, None)
+        if self._refresh_predicate(credentials):
+            return None
+        return credentials
+
     def locked_get(self, key):
         # Check if the credential is already in memory.
         credentials = self._credentials.get(key, None)
@@ -328,6 +398,23 @@ class MultiprocessFileStorage(client.Storage):
     def release_lock(self):
         self._backend.release_lock()
 
+    def get(self):
+        """Retrieves the current credentials from the store.
+
+        If the file hasn't changed since this process last read it and the
+        credentials don't need a refresh, they are returned without taking
+        the locks.
+
+        Returns:
+            An instance of :class:`oauth2client.client.Credentials` or `None`.
+        """
+        credential = self._backend.get_unlocked(self._key)
+        if credential is None:
+            return super(MultiprocessFileStorage, self).get()
+
+        credential.set_store(self)
+        return credential
+
     def locked_get(self):
         """Retrieves the current credentials from the store.
 
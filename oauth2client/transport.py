@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import logging
+import socket
+import threading
+import weakref
 
 import httplib2
 import six
@@ -20,6 +24,11 @@ from six.moves import http_client
 
 from oauth2client import _helpers
 
+try:
+    import urllib3
+except ImportError:  # pragma: NO COVER
+    urllib3 = None
+
 
 _LOGGER = logging.getLogger(__name__)
 # Properties present in file-like streams / buffers.
@@ -27,6 +36,14 @@ _STREAM_PROPERTIES = ('read', 'seek', 'tell')
 
 # Google Data client libraries may need to set this to [401, 403].
 REFRESH_STATUS_CODES = (http_client.UNAUTHORIZED,)
+# How long before the access token expires RefreshTimer refreshes it, and
+# how long it waits to try again after a failed refresh, in seconds.
+REFRESH_MARGIN = 300
+REFRESH_RETRY_DELAY = 30
+
+# The refreshes in progress, by credentials.
+_REFRESHES = weakref.WeakKeyDictionary()
+_REFRESHES_LOCK = threading.Lock()
 
 
 class MemoryCache(object):
@@ -134,6 +151,131 @@ def clean_headers(headers):
     return clean
 
 
+class _Refresh(object):
+    """A refresh in progress, shared by the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+def refresh_once(credentials, http, stale_token=None):
+    """Refreshes credentials, sharing the refresh with concurrent callers.
+
+    Only one refresh per credentials object runs at a time; callers asking
+    while it runs wait for it and get its outcome instead of starting their
+    own. Nothing is done if the access token is no longer stale_token, i.e.
+    another caller already refreshed it.
+
+    Args:
+        credentials: Credentials, the credentials to refresh.
+        http: httplib2.Http or its request method, to be used to make the
+              refresh request. If it was authorized with
+              wrap_http_for_auth(), the request method it wraps is used.
+        stale_token: string, the access token that was found not to work,
+                     or None if there was no token.
+
+    Raises:
+        Exception: whatever the refresh raised, in every waiting caller.
+    """
+    # Refreshing through the authorized request method would wait for this
+    # very refresh if the token endpoint answered with a 401.
+    http = getattr(http, 'request', http)
+    http = getattr(http, 'unauthorized_request', http)
+
+    with _REFRESHES_LOCK:
+        refresh = _REFRESHES.get(credentials)
+        if refresh is None:
+            if (credentials.access_token and
+                    credentials.access_token != stale_token):
+                return
+            refresh = _REFRESHES[credentials] = _Refresh()
+            leader = True
+        else:
+            leader = False
+
+    if not leader:
+        refresh.done.wait()
+        if refresh.error is not None:
+            raise refresh.error
+        return
+
+    try:
+        credentials._refresh(http)
+    except Exception as error:
+        refresh.error = error
+        raise
+    finally:
+        with _REFRESHES_LOCK:
+            del _REFRESHES[credentials]
+        refresh.done.set()
+
+
+class RefreshTimer(object):
+    """Refreshes credentials in the background before the token expires.
+
+    The access token is refreshed margin seconds before its token_expiry,
+    or half way through its life if that is shorter, so that requests don't
+    have to wait for a refresh after a 401. Credentials without a
+    token_expiry are left alone. The refresh goes through refresh_once(), so
+    it is shared with any request that needs one at the same time.
+    """
+
+    def __init__(self, credentials, http=None, margin=REFRESH_MARGIN):
+        """Constructor.
+
+        Args:
+            credentials: OAuth2Credentials, the credentials to keep fresh.
+            http: httplib2.Http, an http object to be used to make the
+                  refresh requests. A new one is made if not given.
+            margin: int, how many seconds before expiry to refresh.
+        """
+        self.credentials = credentials
+        self.http = http or get_http_object()
+        self.margin = margin
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Schedules the next refresh."""
+        expiry = self.credentials.token_expiry
+        if expiry is None:
+            self._schedule(None)
+        else:
+            delta = expiry - datetime.datetime.utcnow()
+            remaining = (delta.days * 86400 + delta.seconds +
+                         delta.microseconds / 1e6)
+            # Tokens that live less than the margin are refreshed half way.
+            delay = max(remaining - self.margin, remaining / 2)
+            self._schedule(max(0, delay))
+
+    def stop(self):
+        """Cancels the next refresh."""
+        self._schedule(None)
+
+    def _schedule(self, delay):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if delay is not None:
+                self._timer = threading.Timer(delay, self._refresh)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _refresh(self):
+        if self.credentials.invalid:
+            return
+        try:
+            refresh_once(self.credentials, self.http.request,
+                         self.credentials.access_token)
+        except Exception as error:
+            _LOGGER.info('Background refresh failed: %s', error)
+            self._schedule(REFRESH_RETRY_DELAY)
+        else:
+            self.start()
+
+
 def wrap_http_for_auth(credentials, http):
     """Prepares an HTTP object's request method for auth.
 
@@ -156,11 +298,12 @@ def wrap_http_for_auth(credentials, http):
         if not credentials.access_token:
             _LOGGER.info('Attempting refresh to obtain '
                          'initial access_token')
-            credentials._refresh(orig_request_method)
+            refresh_once(credentials, orig_request_method)
 
         # Clone and modify the request headers to add the appropriate
         # Authorization header.
         headers = _initialize_headers(headers)
+        token = credentials.access_token
         credentials.apply(headers)
         _apply_user_agent(headers, credentials.user_agent)
 
@@ -183,7 +326,8 @@ def wrap_http_for_auth(credentials, http):
             _LOGGER.info('Refreshing due to a %s (attempt %s/%s)',
                          resp.status, refresh_attempt + 1,
                          max_refresh_attempts)
-            credentials._refresh(orig_request_method)
+            refresh_once(credentials, orig_request_method, token)
+            token = credentials.access_token
             credentials.apply(headers)
             if body_stream_position is not None:
                 body.seek(body_stream_position)
@@ -199,6 +343,7 @@ def wrap_http_for_auth(credentials, http):
 
     # Set credentials as a property of the request method.
     http.request.credentials = credentials
+    http.request.unauthorized_request = orig_request_method
 
 
 def wrap_http_for_jwt_access(credentials, http):
@@ -282,4 +427,129 @@ def request(http, uri, method='GET', body=None, headers=None,
                          connection_type=connection_type)
 
 
+class Urllib3Http(object):
+    """An httplib2.Http compatible object backed by a urllib3.PoolManager.
+
+    Only ``request()`` is provided, which is all that oauth2client and
+    googleapiclient use, so instances can be passed to
+    ``Credentials.authorize()`` and ``googleapiclient.discovery.build()``.
+    Unlike httplib2.Http a single instance can be shared between threads,
+    and connections are pooled per host by urllib3.
+
+    Responses are not cached, and redirects are only followed for GET and
+    HEAD requests.
+    """
+
+    def __init__(self, pool_manager=None, timeout=None, num_pools=10,
+                 maxsize=4, ca_certs=None,
+                 disable_ssl_certificate_validation=False):
+        """Constructor.
+
+        Args:
+            pool_manager: urllib3.PoolManager, the pool manager to use. If
+                          not given one is created from the other arguments.
+            timeout: float, the connect and read timeout in seconds, or None
+                     to block.
+            num_pools: int, the number of hosts to keep pools for.
+            maxsize: int, the number of connections kept for each host.
+            ca_certs: string, the path of a CA certificates bundle. Defaults
+                      to the one bundled with httplib2.
+            disable_ssl_certificate_validation: bool, if True the server
+                                                certificate is not checked.
+
+        Raises:
+            ImportError: urllib3 is not available.
+        """
+        if urllib3 is None:
+            raise ImportError('urllib3 is required to use Urllib3Http')
+        if pool_manager is None:
+            if disable_ssl_certificate_validation:
+                cert_kwargs = {'cert_reqs': 'CERT_NONE'}
+            else:
+                cert_kwargs = {'cert_reqs': 'CERT_REQUIRED',
+                               'ca_certs': ca_certs or httplib2.CA_CERTS}
+            pool_manager = urllib3.PoolManager(num_pools=num_pools,
+                                               maxsize=maxsize,
+                                               **cert_kwargs)
+        self.pool_manager = pool_manager
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        """Make an HTTP request, see httplib2.Http.request().
+
+        Args:
+            uri: string, The URI to be requested.
+            method: string, The HTTP method to use for the request.
+            body: string, The payload / body in HTTP request.
+            headers: dict, Key-value pairs of request headers.
+            redirections: int, The number of redirects to follow.
+            connection_type: Ignored, only accepted for compatibility.
+
+        Returns:
+            tuple, a pair of a httplib2.Response with the status code and
+            other headers and the bytes of the content returned.
+
+        Raises:
+            socket.timeout: the request timed out.
+            socket.error: the connection failed.
+        """
+        headers = _initialize_headers(headers)
+        lower = set(key.lower() for key in headers)
+        if 'user-agent' not in lower:
+            headers['user-agent'] = 'Python-urllib3/%s' % urllib3.__version__
+        if 'range' not in lower and 'accept-encoding' not in lower:
+            headers['accept-encoding'] = 'gzip, deflate'
+
+        follow = method in ('GET', 'HEAD')
+        # googleapiclient retries failed requests itself.
+        retries = urllib3.Retry(total=None, connect=0, read=0,
+                                redirect=redirections if follow else 0,
+                                raise_on_redirect=False)
+        kwargs = {}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        try:
+            response = self.pool_manager.urlopen(method, uri, body=body,
+                                                 headers=headers,
+                                                 redirect=follow,
+                                                 retries=retries, **kwargs)
+        except urllib3.exceptions.HTTPError as error:
+            raise _translate_urllib3_error(error)
+
+        info = dict((key.lower(), value)
+                    for key, value in six.iteritems(response.headers))
+        info['status'] = str(response.status)
+        content = response.data
+        if 'content-encoding' in info:
+            # urllib3 already decoded the content, record it like httplib2.
+            info['-content-encoding'] = info.pop('content-encoding')
+            info['content-length'] = str(len(content))
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, content
+
+
+def _translate_urllib3_error(error):
+    """Maps a urllib3 error to the one httplib2 would have raised.
+
+    Args:
+        error: urllib3.exceptions.HTTPError, the error raised by urllib3.
+
+    Returns:
+        socket.error, the error to raise instead.
+    """
+    if isinstance(error, urllib3.exceptions.MaxRetryError) and error.reason:
+        error = error.reason
+    if isinstance(error, urllib3.exceptions.SSLError) and error.args:
+        if isinstance(error.args[0], Exception):
+            return error.args[0]
+    # NewConnectionError is a TimeoutError, even for refused connections.
+    if isinstance(error, urllib3.exceptions.TimeoutError) and not isinstance(
+            error, urllib3.exceptions.NewConnectionError):
+        return socket.timeout(str(error))
+    return socket.error(str(error))
+
+
 _CACHED_HTTP = httplib2.Http(MemoryCache())
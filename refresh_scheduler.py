@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import time
+
+from gi.repository import GLib
+
+# Seconds between checks, the interval grows while nothing changes
+MIN_INTERVAL = 30
+MAX_INTERVAL = 600
+INTERVAL_GROWTH = 1.5
+# Longest wait after consecutive errors
+MAX_BACKOFF = 1800
+
+
+class RefreshScheduler(object):
+    """
+    Periodically asks the client whether the mailbox changed, and only
+    then refreshes the thread lists. Checks are spaced out while the
+    mailbox stays quiet, backed off exponentially on errors and stopped
+    while paused.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+        self.interval = MIN_INTERVAL
+        self.errors = 0
+        self.paused = False
+        self.started = False
+        self.checking = False
+        self.last_check = 0
+
+        self.__tid = None
+
+    def __schedule(self, seconds):
+        self.__cancel()
+        if self.paused or not self.started:
+            return
+
+        self.__tid = GLib.timeout_add_seconds(int(seconds), self.__check)
+
+    def __cancel(self):
+        if self.__tid is not None:
+            GLib.source_remove(self.__tid)
+            self.__tid = None
+
+    def __check(self):
+        self.__tid = None
+        if self.paused or self.checking:
+            return False
+
+        self.checking = True
+        self.last_check = time.time()
+        self.client.check_for_changes(self.__checked_cb, self.__error_cb)
+        return False
+
+    def __checked_cb(self, changed):
+        self.checking = False
+        self.errors = 0
+
+        if changed:
+            self.interval = MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * INTERVAL_GROWTH, MAX_INTERVAL)
+
+        self.__schedule(self.interval)
+
+    def __error_cb(self, error):
+        self.checking = False
+        self.errors += 1
+
+        self.__schedule(min(MIN_INTERVAL * 2 ** self.errors, MAX_BACKOFF))
+
+    def start(self):
+        self.started = True
+        self.interval = MIN_INTERVAL
+        self.__schedule(self.interval)
+
+    def stop(self):
+        self.started = False
+        self.__cancel()
+
+    def pause(self):
+        self.paused = True
+        self.__cancel()
+
+    def resume(self):
+        if not self.paused:
+            return
+
+        self.paused = False
+        if self.checking:
+            return
+
+        # Check right away if the mailbox hasn't been looked at in a while
+        elapsed = time.time() - self.last_check
+        if elapsed >= MIN_INTERVAL:
+            self.interval = MIN_INTERVAL
+            self.__schedule(0)
+        else:
+            self.__schedule(self.interval - elapsed)
@@ -8,6 +8,28 @@ This module contains the very simple API provided by uritemplate.
 """
 from uritemplate.template import URITemplate
 
+#: Upper bound on the number of parsed templates kept by :func:`_template`.
+TEMPLATE_CACHE_SIZE = 256
+
+_templates = {}
+
+
+def _template(uri):
+    """Return a parsed :class:`URITemplate` for ``uri``.
+
+    Parsing is most of the cost of an expansion and callers tend to expand
+    the same few templates over and over, so parsed templates are kept and
+    reused. Templates are never modified by expanding them, which makes
+    sharing them safe. The cache is simply emptied once it is full.
+
+    """
+    template = _templates.get(uri)
+    if template is None:
+        if len(_templates) >= TEMPLATE_CACHE_SIZE:
+            _templates.clear()
+        template = _templates[uri] = URITemplate(uri)
+    return template
+
 
 def expand(uri, var_dict=None, **kwargs):
     """Expand the template with the given parameters.
@@ -30,7 +52,7 @@ def expand(uri, var_dict=None, **kwargs):
               ``val2`` will be used instead of ``val1``.
 
     """
-    return URITemplate(uri).expand(var_dict, **kwargs)
+    return _template(uri).expand(var_dict, **kwargs)
 
 
 def partial(uri, var_dict=None, **kwargs):
@@ -49,7 +71,7 @@ def partial(uri, var_dict=None, **kwargs):
         t.partial()  # => URITemplate('https://api.github.com{/end}')
 
     """
-    return URITemplate(uri).partial(var_dict, **kwargs)
+    return _template(uri).partial(var_dict, **kwargs)
 
 
 def variables(uri):
@@ -68,4 +90,4 @@ def variables(uri):
         # => {'username', 'repository'}
 
     """
-    return set(URITemplate(uri).variable_names)
+    return set(_template(uri).variable_names)
@@ -0,0 +1,48 @@
+"""
+
+uritemplate.benchmark_api
+=========================
+
+Compares the cost of expanding a request path with a freshly parsed
+:class:`URITemplate` against :func:`uritemplate.api.expand`, which reuses
+parsed templates. Run it with ``python -m uritemplate.benchmark_api``.
+
+"""
+import timeit
+
+from uritemplate import api
+from uritemplate.template import URITemplate
+
+#: Paths of the Gmail methods called on every refresh.
+TEMPLATES = [
+    'https://www.googleapis.com/gmail/v1/users/{userId}/profile',
+    'https://www.googleapis.com/gmail/v1/users/{userId}/labels',
+    'https://www.googleapis.com/gmail/v1/users/{userId}/threads',
+    'https://www.googleapis.com/gmail/v1/users/{userId}/threads/{id}',
+    'https://www.googleapis.com/gmail/v1/users/{userId}/history',
+    'https://www.googleapis.com/gmail/v1/users/{userId}/threads/{id}/modify',
+]
+
+VARIABLES = {'userId': 'me', 'id': '15a1b2c3d4e5f607'}
+
+
+def expand_parsed():
+    for uri in TEMPLATES:
+        URITemplate(uri).expand(VARIABLES)
+
+
+def expand_cached():
+    for uri in TEMPLATES:
+        api.expand(uri, VARIABLES)
+
+
+def main(number=20000):
+    for name, func in [('parsed every time', expand_parsed),
+                       ('cached templates', expand_cached)]:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print('%-18s %.2f us per expansion' % (
+            name, seconds / number / len(TEMPLATES) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,8 @@ import unicodedata
 
 from gettext import gettext as _
 
+from constants import CATEGORIES
+
 TABS = ["", "", "", "", ""]
 MAIL_SPLITTERS = ["<div class=\"gmail_extra\">", "---------- Forwarded message ----------"]
 MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
@@ -300,6 +302,20 @@ def make_html_from_text(text):
     return html
 
 
+def get_thread_label_ids(thread):
+    label_ids = set()
+    for message in thread.get("messages", []):
+        label_ids.update(message.get("labelIds", []))
+
+    return label_ids
+
+
+def set_thread_flags(thread, label_ids):
+    thread["labelIds"] = list(label_ids)
+    for category in CATEGORIES + ["UNREAD"]:
+        thread[category] = category in label_ids
+
+
 def get_message_parts(message):
     parts = []
 
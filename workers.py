@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import Queue
+import logging
+import threading
+
+from gi.repository import GLib
+from gi.repository import GObject
+
+GObject.threads_init()
+
+logger = logging.getLogger(__name__)
+
+
+def idle_call(func, *args):
+    """
+    Call func(*args) once from the GLib main loop.
+    """
+    def call():
+        func(*args)
+        return False
+
+    GLib.idle_add(call)
+
+
+class WorkerPool(object):
+    """
+    A fixed number of daemon threads running jobs from a shared queue.
+    Callbacks are always called from the GLib main loop.
+    """
+
+    def __init__(self, max_workers=4):
+        self.__queue = Queue.Queue()
+        self.__workers = []
+
+        for x in range(max_workers):
+            worker = threading.Thread(target=self.__run)
+            worker.daemon = True
+            worker.start()
+
+            self.__workers.append(worker)
+
+    def __run(self):
+        while True:
+            job = self.__queue.get()
+            if job is None:
+                break
+
+            func, args, callback, error_callback = job
+            try:
+                result = func(*args)
+
+            except Exception as e:
+                logger.exception("Job %r failed", func)
+                if error_callback is not None:
+                    idle_call(error_callback, e)
+
+            else:
+                if callback is not None:
+                    idle_call(callback, result)
+
+            finally:
+                self.__queue.task_done()
+
+    def submit(self, func, args=(), callback=None, error_callback=None):
+        self.__queue.put((func, args, callback, error_callback))
+
+    def get_pending(self):
+        return self.__queue.qsize()
+
+    def shutdown(self):
+        for worker in self.__workers:
+            self.__queue.put(None)